@@ -0,0 +1,11 @@
+"""
+Benchmarks for the memory server.
+
+Run from the repo root:
+- `python -m benchmarks.run` indexes a generated corpus and times the tools
+- `python -m benchmarks.corpus DIR` writes a synthetic projects tree
+- `python -m benchmarks.json_decode` compares JSON decoding backends
+- `python -m benchmarks.memory_footprint DIR` reports resident index size
+
+Results are printed as JSON so they can be compared across versions.
+"""
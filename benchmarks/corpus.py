@@ -0,0 +1,174 @@
+"""
+Synthetic ~/.claude/projects trees for benchmarks.
+
+    python -m benchmarks.corpus DIR [--projects 8] [--sessions 25] [--messages 120] ...
+
+Each session reads like a Claude Code transcript: user prompts, assistant
+text and tool calls with their tool results, TodoWrite updates that
+complete todos as the work goes on (so sessions have chapters), and the
+summary / system / file snapshot lines the indexer skips.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from . import transcripts
+
+
+DEFAULTS = {
+    'projects': 8,
+    'sessions': 25,
+    'messages': 120,
+    'todo_every': 15,
+    'tool_result_bytes': 2000,
+    'large_result_rate': 0.02,
+    'large_result_bytes': 200_000,
+    'days': 365,
+    'seed': 0,
+}
+
+
+def _todo_list(rng: random.Random, count: int) -> List[Dict[str, str]]:
+    return [{'content': transcripts.words(rng, rng.randint(3, 7)).capitalize(),
+             'status': 'pending',
+             'activeForm': 'Working'} for _ in range(count)]
+
+
+def _advance_todos(rng: random.Random, todos: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Complete the todo in progress and start the next one"""
+    todos = [dict(todo) for todo in todos]
+    for todo in todos:
+        if todo['status'] == 'in_progress':
+            todo['status'] = 'completed'
+            break
+    for todo in todos:
+        if todo['status'] == 'pending':
+            todo['status'] = 'in_progress'
+            break
+    else:
+        todos = todos + _todo_list(rng, rng.randint(2, 4))
+    return todos
+
+
+def generate_session(rng: random.Random, session_id: str, start: datetime, messages: int,
+                     todo_every: int, tool_result_bytes: int, large_result_rate: float,
+                     large_result_bytes: int) -> List[str]:
+    """Encoded lines of one session transcript"""
+    ts = start
+    todos = _todo_list(rng, rng.randint(3, 6))
+    lines = [transcripts.dumps(transcripts.summary(rng))]
+
+    def tick():
+        nonlocal ts
+        ts += timedelta(seconds=rng.randint(2, 90))
+        return ts
+
+    count = 0
+    while count < messages:
+        lines.append(transcripts.dumps(transcripts.user_text(rng, session_id, tick(),
+                                                             rng.randint(8, 60))))
+        count += 1
+
+        for _ in range(rng.randint(1, 6)):
+            if count >= messages:
+                break
+            if todo_every and count % todo_every == 0:
+                todos = _advance_todos(rng, todos)
+                lines.append(transcripts.dumps(transcripts.todo_write(rng, session_id, tick(), todos)))
+            else:
+                lines.append(transcripts.dumps(transcripts.tool_use(rng, session_id, tick())))
+
+            size = large_result_bytes if rng.random() < large_result_rate else \
+                int(rng.expovariate(1 / tool_result_bytes)) + 50
+            lines.append(transcripts.dumps(transcripts.tool_result(rng, session_id, tick(), size)))
+            count += 2
+
+        lines.append(transcripts.dumps(transcripts.assistant_text(rng, session_id, tick(),
+                                                                  rng.randint(20, 150))))
+        count += 1
+
+        if rng.random() < 0.05:
+            lines.append(transcripts.dumps(transcripts.system(rng, session_id, tick())))
+        if rng.random() < 0.05:
+            lines.append(transcripts.dumps(transcripts.file_snapshot(rng)))
+
+    return lines
+
+
+def generate_corpus(root: str, projects: int = DEFAULTS['projects'],
+                    sessions: int = DEFAULTS['sessions'], messages: int = DEFAULTS['messages'],
+                    todo_every: int = DEFAULTS['todo_every'],
+                    tool_result_bytes: int = DEFAULTS['tool_result_bytes'],
+                    large_result_rate: float = DEFAULTS['large_result_rate'],
+                    large_result_bytes: int = DEFAULTS['large_result_bytes'],
+                    days: int = DEFAULTS['days'], seed: int = DEFAULTS['seed']) -> List[str]:
+    """
+    Write `projects` x `sessions` session files under root, spread over the
+    last `days` days. Returns the session file paths, oldest first.
+    """
+    rng = random.Random(seed)
+    end = datetime.now(timezone.utc)
+    paths = []
+
+    starts = sorted(end - timedelta(seconds=rng.uniform(0, days * 86400))
+                    for _ in range(projects * sessions))
+    for i, start in enumerate(starts):
+        project_dir = os.path.join(root, f"-Users-dev-Projects-app{i % projects}")
+        os.makedirs(project_dir, exist_ok=True)
+
+        session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        lines = generate_session(rng, session_id, start, messages, todo_every,
+                                 tool_result_bytes, large_result_rate, large_result_bytes)
+        path = os.path.join(project_dir, f"{session_id}.jsonl")
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        mtime = min(start + timedelta(minutes=30), end).timestamp()
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+
+    return paths
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Corpus shape options, shared with the benchmark runner"""
+    parser.add_argument('--projects', type=int, default=DEFAULTS['projects'])
+    parser.add_argument('--sessions', type=int, default=DEFAULTS['sessions'],
+                        help='Sessions per project')
+    parser.add_argument('--messages', type=int, default=DEFAULTS['messages'],
+                        help='Messages per session')
+    parser.add_argument('--todo-every', type=int, default=DEFAULTS['todo_every'],
+                        help='Messages between TodoWrite updates (0 for none)')
+    parser.add_argument('--tool-result-bytes', type=int, default=DEFAULTS['tool_result_bytes'],
+                        help='Mean tool result size')
+    parser.add_argument('--large-result-rate', type=float, default=DEFAULTS['large_result_rate'],
+                        help='Fraction of tool results that are huge')
+    parser.add_argument('--large-result-bytes', type=int, default=DEFAULTS['large_result_bytes'])
+    parser.add_argument('--days', type=int, default=DEFAULTS['days'],
+                        help='Spread sessions over this many days')
+    parser.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+
+
+def corpus_options(args: argparse.Namespace) -> Dict[str, object]:
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='Directory to create the projects tree in')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    paths = generate_corpus(args.root, **corpus_options(args))
+    size = sum(os.path.getsize(path) for path in paths)
+    sys.stdout.write(json.dumps({'sessions': len(paths), 'bytes': size}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
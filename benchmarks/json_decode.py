@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the JSON decoding backends on transcript-shaped lines.
+
+    python -m benchmarks.json_decode [--repeat 5] [--output results.json]
+
+Reports, per backend and line shape, the line size, microseconds per line
+and throughput, plus which backend the server would pick.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from memory.decoder import AVAILABLE_BACKENDS, BACKEND
+
+from . import transcripts
+
+
+def sample_lines(seed: int = 0) -> Dict[str, bytes]:
+    """One encoded line per shape the indexer sees"""
+    rng = random.Random(seed)
+    session_id = 'bench-session'
+    ts = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    todos = [{'content': transcripts.words(rng, 5), 'status': 'pending', 'activeForm': 'x'}
+             for _ in range(6)]
+
+    entries = {
+        'user_text': transcripts.user_text(rng, session_id, ts),
+        'assistant_text': transcripts.assistant_text(rng, session_id, ts, length=200),
+        'assistant_tool_use': transcripts.tool_use(rng, session_id, ts, 'Edit'),
+        'todo_write': transcripts.todo_write(rng, session_id, ts, todos),
+        'tool_result_4k': transcripts.tool_result(rng, session_id, ts, size=4_000),
+        'tool_result_256k': transcripts.tool_result(rng, session_id, ts, size=256_000),
+        'summary': transcripts.summary(rng),
+        'file_snapshot': transcripts.file_snapshot(rng),
+    }
+    return {name: transcripts.dumps(entry).encode('utf-8') for name, entry in entries.items()}
+
+
+def time_decode(loads, line: bytes, repeat: int) -> float:
+    """Best-of-`repeat` seconds per decode"""
+    number = max(1, 2_000_000 // len(line))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            loads(line)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def run(repeat: int = 5) -> Dict:
+    lines = sample_lines()
+    results: Dict[str, Dict] = {}
+
+    for name, loads in AVAILABLE_BACKENDS.items():
+        per_shape = {}
+        for shape, line in lines.items():
+            seconds = time_decode(loads, line, repeat)
+            per_shape[shape] = {
+                'bytes': len(line),
+                'usPerLine': round(seconds * 1e6, 3),
+                'mbPerSec': round(len(line) / seconds / 1e6, 1),
+            }
+        results[name] = per_shape
+
+    return {'selectedBackend': BACKEND, 'backends': results}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Resident size of the in-memory index for a projects directory.
+
+    python -m benchmarks.memory_footprint PROJECTS_DIR [--output results.json]
+
+Indexes every session under PROJECTS_DIR from scratch (no snapshot, one
+process) and reports the Python heap held afterwards by the cache, search
+index and vocabulary, as measured by tracemalloc.
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('projects', help='Directory laid out like ~/.claude/projects')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix='memory-bench-')
+    try:
+        # Configuration is read at import time, so set it before importing memory
+        os.environ['CLAUDE_PROJECTS_PATH'] = os.path.abspath(args.projects)
+        os.environ['CLAUDE_MEMORY_INDEX_PATH'] = os.path.join(scratch, 'index.pickle')
+        os.environ['CLAUDE_MEMORY_NOTES_PATH'] = os.path.join(scratch, 'notes.json')
+        os.environ['CLAUDE_MEMORY_DB_PATH'] = os.path.join(scratch, 'index.db')
+        os.environ['CLAUDE_MEMORY_INDEX_WORKERS'] = '1'
+        os.environ.pop('CLAUDE_MEMORY_BACKEND', None)
+        os.environ.pop('CLAUDE_MEMORY_METRICS_PATH', None)
+
+        from memory import cache
+        from memory.record import get_vocabulary
+
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        cache.refresh_cache()
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        sessions = len(cache.get_cache())
+        index = cache.get_search_index()
+        results = {
+            'sessions': sessions,
+            'vocabulary': len(get_vocabulary()),
+            'stemPostings': sum(len(docs) for postings in index.stems.values()
+                                for docs in postings.values()),
+            'residentBytes': current,
+            'residentBytesPerSession': current // sessions if sessions else 0,
+            'peakBytes': peak,
+            'indexSeconds': round(elapsed, 3),
+        }
+
+        # Saved now, or the exit-time save would recreate the scratch dir
+        cache.flush_snapshot()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+End-to-end benchmark of the memory server's tools.
+
+    python -m benchmarks.run [--projects-dir DIR | corpus options] [--output results.json]
+
+Generates a synthetic projects tree in a temp dir (see benchmarks.corpus),
+or copies an existing one there, and measures by calling the tool
+coroutines directly:
+- cold index time (no snapshot), and a fresh process starting from the
+  snapshot it saved
+- warm refresh time with nothing changed, and after one session grows
+- list_recent, search_memory and read_messages latency percentiles
+- peak RSS
+
+Results are printed as JSON so runs can be compared across versions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from . import corpus, transcripts
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a child process against the saved snapshot: prints seconds and peak RSS
+_WARM_START = """
+import resource, sys, time
+start = time.perf_counter()
+from memory.cache import ensure_cache_fresh
+ensure_cache_fresh()
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Nearest-rank percentiles of latencies in seconds, reported in ms"""
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'p50Ms': round(rank(0.50), 3),
+        'p90Ms': round(rank(0.90), 3),
+        'p99Ms': round(rank(0.99), 3),
+        'maxMs': round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def time_calls(calls: List[Callable[[], Any]]) -> Dict[str, float]:
+    return percentiles([timed(call) for call in calls])
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(projects_dir: str, scratch: str, repeat: int, seed: int) -> Dict[str, Any]:
+    # Configuration is read at import time, so set it before importing memory
+    os.environ['CLAUDE_PROJECTS_PATH'] = projects_dir
+    os.environ['CLAUDE_MEMORY_INDEX_PATH'] = os.path.join(scratch, 'memory-index.pickle')
+    os.environ['CLAUDE_MEMORY_NOTES_PATH'] = os.path.join(scratch, 'memory-notes.json')
+    os.environ['CLAUDE_MEMORY_DB_PATH'] = os.path.join(scratch, 'memory-index.db')
+    os.environ.pop('CLAUDE_MEMORY_BACKEND', None)
+    os.environ.pop('CLAUDE_MEMORY_METRICS_PATH', None)
+    os.environ.pop('CLAUDE_MEMORY_WATCH', None)
+
+    from memory import cache, tools
+    from memory.decoder import BACKEND
+    from memory.snapshot import SHARD_DIR
+
+    results: Dict[str, Any] = {'python': sys.version.split()[0], 'jsonBackend': BACKEND}
+
+    results['coldIndexSeconds'] = round(timed(cache.ensure_cache_fresh), 3)
+    cache.flush_snapshot()
+    results['snapshotBytes'] = sum(entry.stat().st_size for entry in os.scandir(SHARD_DIR))
+
+    child = subprocess.run([sys.executable, '-c', _WARM_START], cwd=REPO_ROOT, env=os.environ,
+                           capture_output=True, text=True, check=True)
+    seconds, rss = child.stdout.split()
+    results['snapshotStartSeconds'] = round(float(seconds), 3)
+    results['snapshotStartPeakRssBytes'] = int(rss) * 1024
+
+    results['warmRefresh'] = time_calls([cache.refresh_cache] * repeat)
+
+    sessions = cache.get_cache()
+    newest = max(sessions.values(), key=lambda data: data.mtime)
+    rng = random.Random(seed)
+
+    # Sweeps only re-stat sessions modified in the last day, and the corpus's
+    # newest one may be months old, so append to a live session of our own
+    live_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    live_path = os.path.join(os.path.dirname(newest.file_path), f"{live_id}.jsonl")
+
+    def append(path: str, session_id: str):
+        line = transcripts.user_text(rng, session_id, datetime.now(timezone.utc), 30)
+        with open(path, 'a') as f:
+            f.write(transcripts.dumps(line) + '\n')
+
+    append(live_path, live_id)
+    cache.refresh_cache()
+    before = sessions[live_id].message_count
+
+    def append_and_refresh():
+        append(live_path, live_id)
+        cache.refresh_cache()
+
+    results['appendRefresh'] = time_calls([append_and_refresh] * repeat)
+    assert sessions[live_id].message_count == before + repeat, "appends were not re-indexed"
+
+    projects = sorted({data.project for data in sessions.values()})
+    session_ids = sorted(sessions)
+
+    def call(tool, **kwargs) -> Callable[[], Any]:
+        return lambda: asyncio.run(tool(**kwargs))
+
+    results['listRecent'] = time_calls(
+        [call(tools.list_recent)] * repeat +
+        [call(tools.list_recent, limit=50, project=rng.choice(projects)) for _ in range(repeat)] +
+        [call(tools.list_recent, after='2000-01-01', before='2100-01-01') for _ in range(repeat)]
+    )
+
+    queries = [' '.join(rng.sample(transcripts.WORDS, rng.randint(1, 3))) for _ in range(repeat)]
+    queries += [os.path.basename(rng.choice(transcripts.FILES)) for _ in range(repeat // 4 or 1)]
+    for ranking in ('classic', 'bm25'):
+        results[f'searchMemory_{ranking}'] = time_calls([
+            call(tools.search_memory, query=query, ranking=ranking,
+                 search_mode=rng.choice(['smart', 'smart', 'todos', 'full', 'files']))
+            for query in queries
+        ])
+
+    read_calls = []
+    for _ in range(repeat):
+        session_id = rng.choice(session_ids)
+        data = sessions[session_id]
+        read_calls.append(call(tools.read_messages, session_id=session_id, chapter=1)
+                          if data.chapters else
+                          call(tools.read_messages, session_id=session_id, start=0, end=20))
+        if data.user_message_count:
+            read_calls.append(call(tools.read_messages, session_id=session_id,
+                                   turn=rng.randint(1, data.user_message_count)))
+        read_calls.append(call(tools.list_chapters, session_id=session_id))
+    results['readMessages'] = time_calls(read_calls)
+
+    results['peakRssBytes'] = _peak_rss()
+    # Saved now, or the exit-time save would recreate the removed scratch dir
+    cache.flush_snapshot()
+    return results
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--projects-dir',
+                        help='Benchmark a copy of an existing projects tree instead')
+    parser.add_argument('--repeat', type=int, default=50, help='Calls per latency measurement')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated corpus')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    corpus.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix='memory-bench-')
+    try:
+        projects_dir = os.path.join(scratch, 'projects')
+        if args.projects_dir:
+            # Sessions get appended to, so never touch the original
+            shutil.copytree(args.projects_dir, projects_dir)
+            shape: Dict[str, Any] = {'path': os.path.abspath(args.projects_dir)}
+        else:
+            options = corpus.corpus_options(args)
+            start = time.perf_counter()
+            corpus.generate_corpus(projects_dir, **options)
+            shape = dict(options, generateSeconds=round(time.perf_counter() - start, 3))
+
+        shape['sessionFiles'] = sum(len([f for f in files if f.endswith('.jsonl')])
+                                for _, _, files in os.walk(projects_dir))
+        shape['bytes'] = sum(os.path.getsize(os.path.join(d, f))
+                             for d, _, files in os.walk(projects_dir) for f in files)
+
+        results = {'corpus': shape}
+        results.update(run(projects_dir, scratch, args.repeat, args.seed))
+    finally:
+        if args.keep:
+            sys.stderr.write(f"Corpus kept in {scratch}\n")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
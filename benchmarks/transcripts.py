@@ -0,0 +1,152 @@
+"""
+Builders for realistic Claude Code transcript entries.
+
+Shapes follow what Claude Code writes to ~/.claude/projects/<project>/<session>.jsonl:
+a common envelope (uuids, cwd, sessionId, timestamp) around user messages,
+assistant messages with text and tool_use blocks, tool results, and the
+summary / system / file snapshot entries the indexer mostly ignores.
+"""
+
+import json
+import random
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+WORDS = (
+    "implement refactor parser cache index search memory session todo chapter "
+    "oauth token refresh webhook server client request response handler route "
+    "database migration schema query transaction test pytest fixture coverage "
+    "deploy build release config environment variable logging metrics latency "
+    "decided because instead approach tradeoff should would could maybe works "
+    "failing error exception retry timeout stream buffer offset file path line"
+).split()
+
+FILES = [
+    "server.py", "memory/cache.py", "memory/tools.py", "memory/extraction.py",
+    "README.md", "tests/test_api.py", "src/app.ts", "package.json", "setup.py",
+]
+
+COMMANDS = [
+    "pytest -k oauth", "git status", "git diff --stat", "python -m compileall -q .",
+    "npm run build", "ls -la", "grep -rn TODO .", "make test",
+]
+
+Entry = Dict[str, Any]
+
+
+def words(rng: random.Random, count: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _envelope(rng: random.Random, session_id: str, timestamp: datetime, entry_type: str) -> Entry:
+    return {
+        'parentUuid': str(uuid.UUID(int=rng.getrandbits(128))),
+        'isSidechain': False,
+        'userType': 'external',
+        'cwd': '/Users/dev/Projects/app',
+        'sessionId': session_id,
+        'version': '1.0.0',
+        'gitBranch': 'main',
+        'type': entry_type,
+        'uuid': str(uuid.UUID(int=rng.getrandbits(128))),
+        'timestamp': timestamp.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+    }
+
+
+def user_text(rng: random.Random, session_id: str, timestamp: datetime, length: int = 30) -> Entry:
+    entry = _envelope(rng, session_id, timestamp, 'user')
+    entry['message'] = {'role': 'user', 'content': words(rng, length)}
+    return entry
+
+
+def tool_result(rng: random.Random, session_id: str, timestamp: datetime, size: int = 2000) -> Entry:
+    output = (words(rng, 50) + '\n') * max(1, size // 400)
+    entry = _envelope(rng, session_id, timestamp, 'user')
+    entry['message'] = {'role': 'user', 'content': [{
+        'tool_use_id': f"toolu_{rng.getrandbits(64):016x}",
+        'type': 'tool_result',
+        'content': output[:size],
+        'is_error': False,
+    }]}
+    entry['toolUseResult'] = {'stdout': output[:size], 'stderr': '', 'interrupted': False}
+    return entry
+
+
+def assistant_text(rng: random.Random, session_id: str, timestamp: datetime, length: int = 60) -> Entry:
+    entry = _envelope(rng, session_id, timestamp, 'assistant')
+    entry['message'] = {
+        'id': f"msg_{rng.getrandbits(64):016x}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': 'claude',
+        'content': [{'type': 'text', 'text': words(rng, length)}],
+        'stop_reason': None,
+        'usage': {'input_tokens': rng.randint(10, 5000), 'output_tokens': rng.randint(10, 2000)},
+    }
+    return entry
+
+
+def tool_use(rng: random.Random, session_id: str, timestamp: datetime,
+             tool: Optional[str] = None) -> Entry:
+    tool = tool or rng.choice(['Read', 'Edit', 'Write', 'Bash', 'Grep', 'WebFetch'])
+    if tool in ('Read', 'Edit', 'Write'):
+        tool_input: Dict[str, Any] = {'file_path': f"/Users/dev/Projects/app/{rng.choice(FILES)}"}
+        if tool == 'Edit':
+            tool_input.update({'old_string': words(rng, 12), 'new_string': words(rng, 14)})
+        elif tool == 'Write':
+            tool_input['content'] = words(rng, 300)
+    elif tool == 'Bash':
+        tool_input = {'command': rng.choice(COMMANDS), 'description': words(rng, 5)}
+    elif tool == 'WebFetch':
+        tool_input = {'url': f"https://docs.example.com/{rng.choice(WORDS)}", 'prompt': words(rng, 8)}
+    else:
+        tool_input = {'pattern': rng.choice(WORDS), 'path': '.'}
+
+    entry = assistant_text(rng, session_id, timestamp, length=15)
+    entry['message']['content'].append({
+        'type': 'tool_use',
+        'id': f"toolu_{rng.getrandbits(64):016x}",
+        'name': tool,
+        'input': tool_input,
+    })
+    return entry
+
+
+def todo_write(rng: random.Random, session_id: str, timestamp: datetime,
+               todos: List[Dict[str, str]]) -> Entry:
+    entry = assistant_text(rng, session_id, timestamp, length=0)
+    entry['message']['content'] = [{
+        'type': 'tool_use',
+        'id': f"toolu_{rng.getrandbits(64):016x}",
+        'name': 'TodoWrite',
+        'input': {'todos': todos},
+    }]
+    return entry
+
+
+def summary(rng: random.Random) -> Entry:
+    return {'type': 'summary', 'summary': words(rng, 6), 'leafUuid': str(uuid.UUID(int=rng.getrandbits(128)))}
+
+
+def system(rng: random.Random, session_id: str, timestamp: datetime) -> Entry:
+    entry = _envelope(rng, session_id, timestamp, 'system')
+    entry.update({'subtype': 'informational', 'content': words(rng, 8), 'level': 'info'})
+    return entry
+
+
+def file_snapshot(rng: random.Random, size: int = 4000) -> Entry:
+    return {
+        'type': 'file-history-snapshot',
+        'messageId': str(uuid.UUID(int=rng.getrandbits(128))),
+        'snapshot': {'trackedFileBackups': {rng.choice(FILES): {'backupFileName': words(rng, 1),
+                                                                'version': 1,
+                                                                'content': words(rng, size // 7)}}},
+        'isSnapshotUpdate': False,
+    }
+
+
+def dumps(entry: Entry) -> str:
+    """Serialize an entry the way Claude Code does (compact, one line)"""
+    return json.dumps(entry, separators=(',', ':'), ensure_ascii=False)
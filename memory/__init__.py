@@ -12,7 +12,50 @@ CLAUDE_PROJECTS_PATH = os.environ.get(
     os.path.expanduser("~/.claude/projects")
 )
 
+# Keep the index live from a background watcher instead of checking for
+# changes on every tool call: "auto", "inotify", "poll", or empty to disable
+WATCH_MODE = os.environ.get("CLAUDE_MEMORY_WATCH", "")
+
+
+def _workers(value: str) -> int:
+    """A worker count setting, falling back to one per CPU if it isn't a number"""
+    try:
+        return max(int(value), 1)
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+# Worker processes used to index large batches of changed files (1 = serial)
+INDEX_WORKERS = _workers(os.environ.get("CLAUDE_MEMORY_INDEX_WORKERS", ""))
+
+# JSON decoder for transcript lines: "orjson" or "json" (e.g. to rule out
+# decoder differences); empty for the fastest one installed
+JSON_BACKEND = os.environ.get("CLAUDE_MEMORY_JSON_BACKEND", "")
+
+# Long transcript lines are skimmed as raw bytes and only decoded when they can
+# matter: "on", "off", or "strict" (decode skimmed lines too and warn whenever
+# the prefilter would have dropped something)
+PREFILTER_MODE = os.environ.get("CLAUDE_MEMORY_PREFILTER", "on")
+
+# Append performance metrics (see the memory_stats tool) to this file on
+# shutdown, as one JSON line per server run; empty to disable
+METRICS_PATH = os.environ.get("CLAUDE_MEMORY_METRICS_PATH", "")
+
 NOTES_PATH = os.environ.get(
     "CLAUDE_MEMORY_NOTES_PATH",
     os.path.expanduser("~/.claude/memory-notes.json")
 )
+
+# Where the index lives: "memory" (in this process, snapshotted to INDEX_PATH)
+# or "sqlite" (an FTS5 database at DB_PATH, shared by every server process)
+STORAGE_BACKEND = os.environ.get("CLAUDE_MEMORY_BACKEND", "memory")
+
+DB_PATH = os.environ.get(
+    "CLAUDE_MEMORY_DB_PATH",
+    os.path.expanduser("~/.claude/memory-index.db")
+)
+
+INDEX_PATH = os.environ.get(
+    "CLAUDE_MEMORY_INDEX_PATH",
+    os.path.expanduser("~/.claude/memory-index.pickle")
+)
@@ -1,64 +1,543 @@
 """
 In-memory cache management for conversation data.
+
+The cache is sharded by project directory: every session is filed under its
+project, a refresh can be limited to some projects, and a project's records
+are only read back from its on-disk snapshot when it is first refreshed.
 """
 
 import os
-import glob as glob_module
-from typing import Dict, Any, Optional
-from datetime import datetime, timezone
+import re
+import sys
+import time
+import atexit
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Set
 
-from . import CLAUDE_PROJECTS_PATH
+from . import CLAUDE_PROJECTS_PATH, INDEX_WORKERS, STORAGE_BACKEND, DB_PATH
+from . import metrics
 from .extraction import extract_conversation_data
+from .snapshot import load_snapshot, save_snapshot, remove_snapshot, load_stems, save_stems
+from .index import SearchIndex
+from .timeline import Timeline, parse_timestamp
+from .record import SessionRecord
+from .stemmer import take_new_stems, load_stem_cache, get_stem_cache
+from .scanner import ProjectScanner
+from .store import SqliteStore
 
 
 # In-memory cache
-_conversation_cache: Dict[str, Dict[str, Any]] = {}
+_conversation_cache: Dict[str, SessionRecord] = {}
+
+# Guards the cache, search index and snapshot when a background watcher
+# refreshes them; readers hold it while they walk the cache.
+_lock = threading.RLock()
+
+# Bumped whenever a refresh changes the cache, so callers can tell how fresh
+# their results are. While a watcher is running, tool calls don't refresh.
+_generation = 0
+_watching = False
+
+# Serializes refreshes, so a watcher and a tool call never sweep at once
+_refresh_lock = threading.Lock()
+
+# Startup warm-up: while it runs, tool calls answer from whatever is indexed
+# so far instead of waiting for the cold parse behind it
+_warming = False
+
+# Files handled / found by the refresh in progress (reported while warming)
+_progress = {'done': 0, 'total': 0}
+
+# The refreshes in flight for async callers (by the projects they cover, None
+# for all), which callers wait on rather than queueing up sweeps of their own
+_refresh_futures: Dict[Optional[Tuple[str, ...]], asyncio.Future] = {}
+
+# Inverted index and start-time ordering kept in step with the cache
+_search_index = SearchIndex()
+_timeline = Timeline()
+
+# Shards: project directory name -> its cached sessions, and their start-time
+# ordering, for queries filtered by project
+_project_sessions: Dict[str, Set[str]] = {}
+_project_timelines: Dict[str, Timeline] = {}
+
+# With the sqlite backend, sessions are kept in the database instead of the
+# cache, search index and snapshot above, which stay empty
+_db: Optional[SqliteStore] = SqliteStore(DB_PATH) if STORAGE_BACKEND == 'sqlite' else None
+
+# Tracks which session files changed since the last refresh
+_scanner = ProjectScanner(CLAUDE_PROJECTS_PATH)
+
+# On-disk snapshot state: each project's shard is loaded the first time that
+# project is refreshed, and changed shards are saved at most every
+# SNAPSHOT_SAVE_INTERVAL seconds while the active session keeps changing
+SNAPSHOT_SAVE_INTERVAL = 30.0
+_snapshot: Dict[str, SessionRecord] = {}
+_loaded_shards: Set[str] = set()
+_dirty_shards: Set[str] = set()
+_stems_loaded = False
+_snapshot_saved_at = 0.0
+
+# Below this many changed files, pool startup costs more than it saves
+PARALLEL_MIN_FILES = 64
+
+# How index workers are started: never plain fork, from a threaded process
+_START_METHOD = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                 else 'spawn')
+
+# (session_id, file_path, stat, extraction state to resume from or None)
+_Job = Tuple[str, str, os.stat_result, Optional[Dict[str, Any]]]
 
 
-def get_cache() -> Dict[str, Dict[str, Any]]:
+def get_cache() -> Dict[str, SessionRecord]:
     """Get the conversation cache"""
     return _conversation_cache
 
 
-def ensure_cache_fresh():
+def get_search_index() -> SearchIndex:
+    """Get the inverted index over the conversation cache"""
+    return _search_index
+
+
+def get_timeline() -> Timeline:
+    """Get the cached sessions in start-time order"""
+    return _timeline
+
+
+def get_project_sessions(projects: Iterable[str]) -> Set[str]:
+    """Cached sessions of the given projects. Call under the cache lock."""
+    sessions: Set[str] = set()
+    for project in projects:
+        sessions |= _project_sessions.get(project, set())
+    return sessions
+
+
+def get_project_timelines(projects: Iterable[str]) -> List[Timeline]:
+    """Start-time orderings of the given projects' sessions. Use under the cache lock."""
+    return [_project_timelines[project] for project in projects
+            if project in _project_timelines]
+
+
+def projects_matching(project_filter: str) -> List[str]:
+    """Project directory names containing the filter (as the tools' project filter matches)"""
+    return [name for name in map(os.path.basename, _scanner.list_project_dirs())
+            if project_filter in name]
+
+
+def get_store() -> Optional[SqliteStore]:
+    """Get the SQLite store, or None when the index is kept in memory"""
+    return _db
+
+
+def cache_lock() -> threading.RLock:
+    """Lock to hold while reading the cache and search index"""
+    return _lock
+
+
+def get_generation() -> int:
+    """Get the index generation (increases whenever the cache changes)"""
+    return _generation
+
+
+def get_shard_counts() -> Dict[str, int]:
+    """Projects with cached sessions, and how many of their snapshots were read"""
+    return {'projects': len(_project_timelines), 'loaded': len(_loaded_shards)}
+
+
+def get_indexing_progress() -> Optional[Dict[str, int]]:
+    """Files indexed so far / found by the startup warm-up, or None once it is done"""
+    if not _warming:
+        return None
+    return dict(_progress)
+
+
+def set_watching(watching: bool):
+    """Mark the cache as kept live by a background watcher"""
+    global _watching
+    _watching = watching
+
+
+def _store(session_id: str, data: SessionRecord):
+    """Put a record in the cache and re-post it in the search index"""
+    with _lock:
+        old = _conversation_cache.get(session_id)
+        if old is not None:
+            _search_index.remove(session_id, old)
+            _unfile(session_id, old.project)
+        _conversation_cache[session_id] = data
+        _search_index.add(session_id, data)
+        _timeline.add(session_id, data.timestamp)
+        _project_sessions.setdefault(data.project, set()).add(session_id)
+        _project_timelines.setdefault(data.project, Timeline()).add(session_id, data.timestamp)
+
+
+def _unfile(session_id: str, project: str):
+    """Take a session out of its project's shard"""
+    _project_sessions.get(project, set()).discard(session_id)
+    timeline = _project_timelines.get(project)
+    if timeline is not None:
+        timeline.remove(session_id)
+
+
+def _drop(file_path: str):
+    """Forget a deleted session file"""
+    if _db is not None:
+        _db.remove_file(file_path)
+        return
+
+    session_id = os.path.basename(file_path).replace('.jsonl', '')
+    with _lock:
+        data = _conversation_cache.get(session_id)
+        if data is not None and data.file_path == file_path:
+            _search_index.remove(session_id, data)
+            _timeline.remove(session_id)
+            _unfile(session_id, data.project)
+            del _conversation_cache[session_id]
+            _dirty_shards.add(data.project)
+        _snapshot.pop(file_path, None)
+
+
+def _is_current(data: SessionRecord, st: os.stat_result) -> bool:
+    """Check whether a record was extracted from the file as it is now"""
+    return data.mtime == st.st_mtime and data.size == st.st_size
+
+
+def ensure_cache_fresh(projects: Optional[Iterable[str]] = None):
+    """
+    Check file mtimes and re-parse only changed conversations, in every
+    project or only the given ones (project directory names).
+    First run: ~5s to parse all files (near-instant with a warm snapshot,
+    split across INDEX_WORKERS processes for large batches)
+    Subsequent: stat calls for project dirs and recently active sessions only;
+    deleted session files are dropped from the cache. Appends to a session
+    idle for over a day (e.g. one resumed) are only seen by the next full
+    sweep, so can be up to FULL_SWEEP_INTERVAL (5 min) late.
+    With a background watcher running this is a no-op: the cache is already live.
+    So it is while the startup warm-up runs: callers get what is indexed so far.
+    (`python -m benchmarks.run` measures these on a generated corpus.)
+    """
+    if not _watching and not _warming:
+        refresh_cache(projects)
+
+
+def start_warmup() -> threading.Thread:
+    """
+    Index in a background thread, the current project's shard first and then
+    everything else newest sessions first, so tools can answer from the most
+    recent sessions while older ones are still being parsed
+    """
+    global _warming
+
+    _warming = True
+    thread = threading.Thread(target=_warm, name='memory-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def _current_project() -> Optional[str]:
+    """The project directory Claude Code keeps the working directory's sessions in"""
+    name = re.sub(r'[^A-Za-z0-9]', '-', os.getcwd())
+    return name if os.path.isdir(os.path.join(CLAUDE_PROJECTS_PATH, name)) else None
+
+
+def _warm():
+    global _warming
+
+    try:
+        current = _current_project()
+        if current is not None:
+            refresh_cache([current])
+        refresh_cache()
+    except Exception as e:
+        print(f"Error warming index: {e}", file=sys.stderr)
+    finally:
+        _warming = False
+
+
+async def ensure_cache_fresh_async(projects: Optional[Iterable[str]] = None):
+    """
+    ensure_cache_fresh in a worker thread, off the event loop. Concurrent
+    callers share one in-flight refresh of the same projects instead of each
+    sweeping again.
     """
-    Check file mtimes and re-parse only changed conversations.
-    First run: ~5s to parse all files
-    Subsequent: ~60ms (stat calls + search)
+    if _watching or _warming:
+        return
+    key = tuple(sorted(projects)) if projects is not None else None
+    future = _refresh_futures.get(key)
+    if future is None or future.done():
+        future = _refresh_futures[key] = asyncio.ensure_future(
+            asyncio.to_thread(refresh_cache, key))
+    # One caller being cancelled must not cancel the refresh the others await
+    await asyncio.shield(future)
+
+
+def refresh_cache(projects: Optional[Iterable[str]] = None):
     """
-    global _conversation_cache
+    Sweep the projects root for changes and apply them, or only the given
+    projects' directories (the rest of the cache is left as it is)
+    """
+    with _refresh_lock, metrics.timer('refresh'):
+        if projects is None:
+            project_dirs = None
+            names = [os.path.basename(d) for d in _scanner.list_project_dirs()]
+        else:
+            names = list(projects)
+            project_dirs = [os.path.join(CLAUDE_PROJECTS_PATH, name) for name in names]
+        _load_shards(names)
+        swept = _scanner.last_full_sweep
+        with metrics.timer('refresh.scan'):
+            changed, removed = _scanner.scan(project_dirs)
+            if _db is not None and _scanner.last_full_sweep != swept:
+                removed += _stale_db_files()
+        _apply_changes(changed, removed)
+
+
+def _stale_db_files() -> List[str]:
+    """
+    Stored sessions whose files are gone but weren't seen going (deleted while
+    no server was running), after a full sweep has listed every project
+    """
+    found = {path for files in _scanner.files.values() for path in files}
+    gone_dirs: Dict[str, bool] = {}
+    stale = []
+    for file_path in _db.file_paths():
+        if file_path in found:
+            continue
+        project_dir = os.path.dirname(file_path)
+        if project_dir not in gone_dirs:
+            # A directory the sweep couldn't list is kept, unless it no longer exists
+            gone_dirs[project_dir] = (project_dir in _scanner.files or
+                                      not os.path.isdir(project_dir))
+        if gone_dirs[project_dir]:
+            stale.append(file_path)
+    return stale
+
+
+def refresh_paths(paths: Iterable[str]):
+    """Re-index specific session files (e.g. reported by a watcher)"""
+    changed: Dict[str, os.stat_result] = {}
+    removed: List[str] = []
+
+    for file_path in paths:
+        try:
+            changed[file_path] = os.stat(file_path)
+        except FileNotFoundError:
+            removed.append(file_path)
+        except OSError:
+            continue
+
+    with _refresh_lock, metrics.timer('refresh.paths'):
+        _load_shards({os.path.basename(os.path.dirname(path)) for path in [*changed, *removed]})
+        _apply_changes(changed, removed)
+
+
+def _load_shards(projects: Iterable[str]):
+    """Read the snapshots of projects not refreshed before in this process"""
+    global _stems_loaded
+
+    if _db is not None:
+        return
+    projects = [project for project in projects if project not in _loaded_shards]
+    if not projects:
+        return
+
+    with metrics.timer('snapshot.load'):
+        if not _stems_loaded:
+            load_stems()
+            _stems_loaded = True
+        for project in projects:
+            _snapshot.update(load_snapshot(project))
+            _loaded_shards.add(project)
+
 
-    all_files = glob_module.glob(os.path.join(CLAUDE_PROJECTS_PATH, "*", "*.jsonl"))
+def _apply_changes(changed: Dict[str, os.stat_result], removed: List[str]):
+    """Drop deleted files, then adopt or (re-)extract changed ones"""
+    global _generation
 
-    for file_path in all_files:
+    if not changed and not removed:
+        return
+
+    metrics.increment('refresh.files_removed', len(removed))
+    for file_path in removed:
+        _drop(file_path)
+
+    pending: List[_Job] = []
+    _progress['done'], _progress['total'] = 0, len(changed)
+
+    # Newest first, so the sessions asked about most are queryable soonest
+    for file_path, st in sorted(changed.items(), key=lambda item: item[1].st_mtime,
+                                reverse=True):
         try:
-            current_mtime = os.path.getmtime(file_path)
             filename = os.path.basename(file_path)
             session_id = filename.replace('.jsonl', '')
 
-            if (session_id not in _conversation_cache or
-                _conversation_cache[session_id].get('mtime', 0) < current_mtime):
+            if _db is not None:
+                pending.extend(_db_job(session_id, file_path, st))
+                continue
+
+            cached = _conversation_cache.get(session_id)
+            if cached is not None and _is_current(cached, st):
+                metrics.increment('refresh.files_unchanged')
+                _progress['done'] += 1
+                continue
 
-                data = extract_conversation_data(file_path)
-                data['mtime'] = current_mtime
-                data['file_path'] = file_path
+            stored = _snapshot.get(file_path)
+            if cached is None and stored is not None and _is_current(stored, st):
+                _store(session_id, stored)
+                metrics.increment('refresh.files_from_snapshot')
+                _progress['done'] += 1
+                continue
 
-                _conversation_cache[session_id] = data
+            # Session files are append-only, so a grown file only needs
+            # its new lines parsed on top of the previous record
+            previous = cached if cached is not None else stored
+            if previous is not None and (previous.file_path != file_path or
+                                         previous.size > st.st_size):
+                previous = None
+
+            pending.append((session_id, file_path, st,
+                            previous.extraction_state() if previous is not None else None))
 
         except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+            print(f"Error processing {file_path}: {e}", file=sys.stderr)
+            metrics.increment('refresh.errors')
+            _progress['done'] += 1
             continue
 
+    metrics.increment('refresh.files_extracted', len(pending))
+    if INDEX_WORKERS > 1 and len(pending) >= PARALLEL_MIN_FILES:
+        _extract_parallel(pending)
+    else:
+        _extract_serial(pending)
 
-def parse_timestamp(ts: str) -> Optional[datetime]:
-    """Parse ISO timestamp string to datetime, normalized to UTC"""
-    if not ts:
-        return None
+    with _lock:
+        _generation += 1
+
+    if _dirty_shards and time.monotonic() - _snapshot_saved_at >= SNAPSHOT_SAVE_INTERVAL:
+        flush_snapshot()
+
+
+def _db_job(session_id: str, file_path: str, st: os.stat_result) -> List[_Job]:
+    """The extraction a changed file needs against the SQLite store, if any"""
+    stamp = _db.stamp(session_id)
+    if stamp is not None and stamp == (file_path, st.st_mtime, st.st_size):
+        # Already stored, by this process or another one sharing the database
+        metrics.increment('refresh.files_unchanged')
+        _progress['done'] += 1
+        return []
+
+    previous = None
+    if stamp is not None and stamp[0] == file_path and stamp[2] <= st.st_size:
+        previous = _db.extracted(session_id)
+    return [(session_id, file_path, st, previous)]
+
+
+def _finish(session_id: str, file_path: str, st: os.stat_result, extracted: Dict[str, Any]):
+    """Compact freshly extracted data into a record and store it"""
+    if _db is not None:
+        _db.put(session_id, extracted, file_path, st.st_mtime, st.st_size)
+        _progress['done'] += 1
+        return
+
+    with _lock:
+        data = SessionRecord.from_extracted(extracted, file_path, st.st_mtime, st.st_size)
+        _store(session_id, data)
+        _snapshot[file_path] = data
+        _dirty_shards.add(data.project)
+    _progress['done'] += 1
+
+
+def _extract_serial(pending: List[_Job]):
+    """Extract changed files one after another in this process"""
+    for session_id, file_path, st, previous in pending:
+        try:
+            _finish(session_id, file_path, st, extract_conversation_data(file_path, previous))
+        except Exception as e:
+            print(f"Error processing {file_path}: {e}", file=sys.stderr)
+            metrics.increment('refresh.errors')
+            _progress['done'] += 1
+            _scanner.forget(file_path)
+
+
+def _init_worker(stems: Dict[str, str]):
+    """
+    Start a pool worker from a clean slate, so it only reports its own work,
+    but with the parent's stem memo
+    """
+    metrics.drain()
+    load_stem_cache(stems)
+    take_new_stems()
+
+
+def _extract_job(file_path: str, previous: Optional[Dict[str, Any]]):
+    """
+    Worker side of _extract_parallel: the extracted data, the worker's
+    metrics and the words it stemmed, for the parent's memo
+    """
+    data = extract_conversation_data(file_path, previous)
+    return data, metrics.drain(), take_new_stems()
+
+
+def _extract_parallel(pending: List[_Job]):
+    """Fan extraction out over a process pool, storing results as they arrive"""
     try:
-        ts = ts.replace('Z', '+00:00')
-        dt = datetime.fromisoformat(ts)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
-    except:
-        return None
+        # Not forked from this process: another thread (a tool call, the
+        # watcher) may hold a lock that a forked worker would inherit held
+        pool = ProcessPoolExecutor(max_workers=min(INDEX_WORKERS, len(pending)),
+                                   mp_context=multiprocessing.get_context(_START_METHOD),
+                                   initializer=_init_worker,
+                                   initargs=(dict(get_stem_cache()),))
+    except Exception as e:
+        print(f"Error starting index workers, indexing serially: {e}", file=sys.stderr)
+        _extract_serial(pending)
+        return
+
+    with pool:
+        futures = {
+            pool.submit(_extract_job, file_path, previous): (session_id, file_path, st)
+            for session_id, file_path, st, previous in pending
+        }
+        for future in as_completed(futures):
+            session_id, file_path, st = futures[future]
+            try:
+                data, worker_metrics, stems = future.result()
+                metrics.merge(worker_metrics)
+                load_stem_cache(stems)
+                _finish(session_id, file_path, st, data)
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}", file=sys.stderr)
+                metrics.increment('refresh.errors')
+                _progress['done'] += 1
+                _scanner.forget(file_path)
+
+
+def flush_snapshot():
+    """Persist the shards that changed since they were last saved"""
+    global _snapshot_saved_at
+
+    with _lock:
+        if not _dirty_shards:
+            return
+        shards = {
+            project: {data.file_path: data for data in
+                      (_conversation_cache[session_id]
+                       for session_id in _project_sessions.get(project, ()))}
+            for project in _dirty_shards
+        }
+        _dirty_shards.clear()
+        _snapshot_saved_at = time.monotonic()
+
+    with metrics.timer('snapshot.save'):
+        for project, records in shards.items():
+            if records:
+                save_snapshot(project, records)
+            else:
+                remove_snapshot(project)
+        save_stems()
+
+
+atexit.register(flush_snapshot)
+
@@ -0,0 +1,32 @@
+"""
+JSON decoding backend for transcript lines.
+
+Decoding is the hottest step of indexing, so when orjson is installed it is
+used to decode raw bytes directly; otherwise the stdlib json module is used.
+The backend is picked once at import time. Both raise ValueError subclasses
+on malformed lines.
+"""
+
+import json
+from typing import Any, Callable, Dict, Union
+
+from . import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Every backend usable in this environment, by name (for benchmarks)
+AVAILABLE_BACKENDS: Dict[str, Callable[[Union[bytes, str]], Any]] = {'json': json.loads}
+if orjson is not None:
+    AVAILABLE_BACKENDS['orjson'] = orjson.loads
+
+# JSON_BACKEND pins a backend if it is available; otherwise the fastest one wins
+if JSON_BACKEND in AVAILABLE_BACKENDS:
+    BACKEND = JSON_BACKEND
+else:
+    BACKEND = 'orjson' if orjson is not None else 'json'
+
+loads: Callable[[Union[bytes, str]], Any] = AVAILABLE_BACKENDS[BACKEND]
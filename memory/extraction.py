@@ -3,27 +3,244 @@ Data extraction from Claude Code conversation files.
 """
 
 import os
-import json
-from typing import List, Dict, Any, Set
+import re
+import mmap
+import sys
+import time
+from array import array
+from collections import Counter
+from typing import List, Dict, Any, Set, Tuple, Optional, Iterator
 
-from .stemmer import stem_text
+from . import PREFILTER_MODE
+from . import metrics
+from .decoder import loads
+from .stemmer import stem_counts
+
+
+# Lines shorter than this are always decoded: skimming them saves nothing
+PREFILTER_MIN_BYTES = 4096
+
+# Structural markers. Quotes inside JSON strings are escaped, so these byte
+# patterns only match real keys (Claude Code writes compact JSON).
+_TYPE_MARKER = re.compile(rb'"type":"([A-Za-z_-]+)"')
+_TIMESTAMP = re.compile(rb'"timestamp":"([^"\\]*)"')
+
+# Block types a message can hold without contributing anything but its
+# position: tool results carry no user text, thinking is never indexed
+_USER_SKIMMABLE = {b'user', b'tool_result', b'image'}
+_ASSISTANT_SKIMMABLE = {b'assistant', b'message', b'thinking', b'redacted_thinking'}
+
+
+def skim_line(line: bytes, with_timestamp: bool = False) -> Optional[dict]:
+    """
+    Classify a raw transcript line from its markers without decoding it.
+    Returns None if the line has to be decoded, {} for a line that is not a
+    user or assistant message (summaries, snapshots, progress, system), or a
+    stand-in entry for a message with nothing to index (only tool results,
+    or only thinking). Stand-ins carry the timestamp when asked for; a line
+    holding more than one timestamp is decoded instead.
+    """
+    markers = set(_TYPE_MARKER.findall(line))
+    if not markers:
+        return None
+    if b'user' not in markers and b'assistant' not in markers:
+        return {}
+    if b'"message":{' not in line:
+        return None
+
+    if b'tool_result' in markers and markers <= _USER_SKIMMABLE:
+        entry = {'type': 'user', 'message': {'role': 'user', 'content': []}}
+    elif markers <= _ASSISTANT_SKIMMABLE:
+        entry = {'type': 'assistant', 'message': {'role': 'assistant', 'content': []}}
+    else:
+        return None
+
+    if with_timestamp:
+        timestamps = set(_TIMESTAMP.findall(line))
+        if len(timestamps) > 1:
+            return None
+        if timestamps:
+            entry['timestamp'] = timestamps.pop().decode('utf-8')
+    return entry
+
+
+def _skim_matches(skimmed: dict, entry: Any, with_timestamp: bool) -> bool:
+    """Check a skimmed line against its full decode (strict mode)"""
+    if not isinstance(entry, dict):
+        return False
+    if not skimmed:
+        return entry.get('type') not in ('user', 'assistant')
+    if entry.get('type') != skimmed['type'] or not entry.get('message'):
+        return False
+    if with_timestamp and entry.get('timestamp', '') != skimmed.get('timestamp', ''):
+        return False
+    if skimmed['type'] == 'user':
+        return not extract_text_content(entry['message'].get('content', ''))
+    return not any(isinstance(item, dict) and item.get('type') in ('text', 'tool_use')
+                   for item in entry['message'].get('content', []))
+
+
+def decode_line(line: bytes, skim: bool = False, with_timestamp: bool = False) -> Optional[dict]:
+    """
+    Decode one transcript line. With `skim`, long lines go through the raw
+    prefilter first: lines that aren't messages come back as None and
+    messages with nothing to index as stand-ins (see skim_line).
+    Raises ValueError on malformed lines.
+    """
+    if not skim or PREFILTER_MODE == 'off' or len(line) < PREFILTER_MIN_BYTES:
+        return loads(line)
+
+    skimmed = skim_line(line, with_timestamp)
+    if skimmed is None:
+        return loads(line)
+
+    if PREFILTER_MODE == 'strict':
+        entry = loads(line)
+        if not _skim_matches(skimmed, entry, with_timestamp):
+            print(f"Prefilter mismatch, using full decode: {line[:120]!r}", file=sys.stderr)
+            return entry
+
+    metrics.increment('decode.skimmed_lines')
+    return skimmed or None
+
+
+class JsonlReader:
+    """
+    Iterate (line offset, entry) pairs of a JSONL file from a byte offset,
+    decoding one line at a time. After iterating, `offset` is where to
+    resume next time.
+
+    A trailing line without a newline is only consumed if it decodes,
+    so a line that is still being written is picked up on the next read.
+
+    While `skim` is set, long lines that cannot matter to extraction are
+    passed over or replaced by stand-ins instead of being decoded (see
+    decode_line); it can be switched on mid-iteration.
+    """
+
+    def __init__(self, file_path: str, offset: int = 0, skim: bool = False):
+        self.file_path = file_path
+        self.offset = offset
+        self.skim = skim
+        # Non-empty lines read, for metrics
+        self.lines = 0
+
+    def __iter__(self) -> Iterator[Tuple[int, dict]]:
+        try:
+            with open(self.file_path, 'rb') as f:
+                f.seek(self.offset)
+                for raw in f:
+                    line_offset = self.offset
+                    complete = raw.endswith(b'\n')
+                    if complete:
+                        self.offset += len(raw)
+                    line = raw.strip()
+                    if not line:
+                        continue
+                    self.lines += 1
+                    try:
+                        # A line still being written must be decoded to prove it is whole
+                        entry = decode_line(line, self.skim and complete)
+                    except ValueError:
+                        continue
+                    if not complete:
+                        self.offset += len(raw)
+                    if entry is not None:
+                        yield line_offset, entry
+        except Exception as e:
+            print(f"Error reading file {self.file_path}: {e}", file=sys.stderr)
+
+
+def read_jsonl_from(file_path: str, offset: int = 0) -> Tuple[List[Tuple[int, dict]], int]:
+    """
+    Parse the lines of a JSONL file starting at a byte offset.
+    Returns (line offset, entry) pairs and the offset to resume from next time.
+    """
+    reader = JsonlReader(file_path, offset)
+    entries = list(reader)
+    return entries, reader.offset
 
 
 def parse_jsonl_file(file_path: str) -> List[dict]:
     """Parse a JSONL file and return raw entries"""
-    entries = []
+    return [entry for _, entry in read_jsonl_from(file_path)[0]]
+
+
+def read_entries_at(file_path: str, offsets: List[int], skim: bool = False) -> List[Optional[dict]]:
+    """
+    Decode only the lines starting at the given byte offsets (None if unreadable).
+    With `skim`, long messages with no text come back as stand-ins (see skim_line).
+    """
+    entries: List[Optional[dict]] = []
+    bytes_read = 0
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
+        with open(file_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                line = f.readline()
+                bytes_read += len(line)
+                try:
+                    entries.append(decode_line(line.strip(), skim, with_timestamp=True))
+                except ValueError:
+                    entries.append(None)
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}", file=sys.stderr)
+    metrics.increment('read.lines', len(entries))
+    metrics.increment('read.bytes', bytes_read)
+    return entries
+
+
+def read_messages_backward(file_path: str, stop: int = 0) -> Iterator[Tuple[int, dict]]:
+    """
+    (line offset, entry) for the user and assistant messages of a JSONL file,
+    newest first, scanning a memory map back from the end to byte `stop` (a
+    line start). Only lines carrying a user or assistant marker are decoded,
+    long messages with no text come back as stand-ins (see skim_line), and an
+    unfinished last line is left for later.
+    """
+    lines = 0
+    bytes_read = 0
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= stop:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b'\n', stop, size) + 1
+                while end > stop:
+                    start = max(stop, mm.rfind(b'\n', stop, end - 1) + 1)
+                    line = mm[start:end].strip()
+                    bytes_read += end - start
+                    end = start
+                    if not line:
+                        continue
+                    markers = _TYPE_MARKER.findall(line)
+                    if b'user' not in markers and b'assistant' not in markers:
+                        continue
+                    lines += 1
                     try:
-                        entries.append(json.loads(line))
-                    except json.JSONDecodeError:
+                        entry = decode_line(line, skim=True, with_timestamp=True)
+                    except ValueError:
                         continue
+                    if entry and entry.get('type') in ('user', 'assistant') and entry.get('message'):
+                        yield start, entry
     except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-    return entries
+        print(f"Error reading file {file_path}: {e}", file=sys.stderr)
+    finally:
+        metrics.increment('read.lines', lines)
+        metrics.increment('read.bytes', bytes_read)
+
+
+def _can_resume(file_path: str, offset: int) -> bool:
+    """Check that a file still ends a complete line at a previous read offset"""
+    if offset <= 0:
+        return False
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(offset - 1)
+            return f.read(1) == b'\n'
+    except OSError:
+        return False
 
 
 def extract_text_content(content: Any) -> str:
@@ -43,83 +260,64 @@ def extract_text_content(content: Any) -> str:
     return ""
 
 
-def extract_activity_signals(entries: List[dict]) -> Dict[str, List[str]]:
-    """
-    Extract activity signals from tool calls:
-    - Files touched (Read, Write, Edit)
-    - Commands run (Bash)
-    - URLs fetched (WebFetch)
-    """
-    files_touched: Set[str] = set()
-    commands_run: Set[str] = set()
-    urls_fetched: Set[str] = set()
+def collect_activity(entry: dict, files_touched: Set[str], commands_run: Set[str],
+                     urls_fetched: Set[str]):
+    """Add the activity signals from one entry's tool calls to the given sets"""
+    if entry.get('type') != 'assistant' or not entry.get('message'):
+        return
 
-    for entry in entries:
-        if entry.get('type') != 'assistant' or not entry.get('message'):
+    for content_item in entry['message'].get('content', []):
+        if not isinstance(content_item, dict) or content_item.get('type') != 'tool_use':
             continue
 
-        for content_item in entry['message'].get('content', []):
-            if not isinstance(content_item, dict) or content_item.get('type') != 'tool_use':
-                continue
-
-            tool_name = content_item.get('name', '')
-            tool_input = content_item.get('input', {})
-
-            if tool_name in ['Read', 'Write', 'Edit']:
-                file_path = tool_input.get('file_path', '')
-                if file_path:
-                    files_touched.add(os.path.basename(file_path))
-                    files_touched.add(file_path)
-
-            if tool_name == 'Bash':
-                command = tool_input.get('command', '')
-                if command:
-                    cmd_short = command.split()[0] if command.split() else ''
-                    if cmd_short:
-                        commands_run.add(cmd_short)
-                    commands_run.add(command[:100])
+        tool_name = content_item.get('name', '')
+        tool_input = content_item.get('input', {})
 
-            if tool_name == 'WebFetch':
-                url = tool_input.get('url', '')
-                if url:
-                    urls_fetched.add(url)
+        if tool_name in ['Read', 'Write', 'Edit']:
+            file_path = tool_input.get('file_path', '')
+            if file_path:
+                files_touched.add(os.path.basename(file_path))
+                files_touched.add(file_path)
 
-    return {
-        'files_touched': list(files_touched),
-        'commands_run': list(commands_run),
-        'urls_fetched': list(urls_fetched)
-    }
+        if tool_name == 'Bash':
+            command = tool_input.get('command', '')
+            if command:
+                cmd_short = command.split()[0] if command.split() else ''
+                if cmd_short:
+                    commands_run.add(cmd_short)
+                commands_run.add(command[:100])
 
+        if tool_name == 'WebFetch':
+            url = tool_input.get('url', '')
+            if url:
+                urls_fetched.add(url)
 
-def extract_full_text(entries: List[dict]) -> str:
-    """Extract all text content from a conversation for full-text search"""
-    text_parts = []
 
-    for entry in entries:
-        if entry.get('type') == 'user' and entry.get('message'):
-            content = extract_text_content(entry['message'].get('content', ''))
-            if content:
-                text_parts.append(content)
+def entry_text_parts(entry: dict) -> List[str]:
+    """Text from one entry that goes into full-text search"""
+    if entry.get('type') == 'user' and entry.get('message'):
+        content = extract_text_content(entry['message'].get('content', ''))
+        return [content] if content else []
 
-        elif entry.get('type') == 'assistant' and entry.get('message'):
-            for item in entry['message'].get('content', []):
-                if isinstance(item, dict) and item.get('type') == 'text':
-                    text_parts.append(item.get('text', ''))
+    if entry.get('type') == 'assistant' and entry.get('message'):
+        return [item.get('text', '') for item in entry['message'].get('content', [])
+                if isinstance(item, dict) and item.get('type') == 'text']
 
-    return ' '.join(text_parts)
+    return []
 
 
-def calculate_chapters(todo_snapshots: List[Dict]) -> List[Dict]:
+def calculate_chapters(todo_snapshots: List[Dict], chapters: Optional[List[Dict]] = None) -> List[Dict]:
     """
     Calculate chapter breaks based on when todos were completed.
     Each completed todo marks the end of a phase of work.
+    Given the chapters of earlier snapshots, continues from where they left off.
     """
+    chapters = list(chapters or [])
     if not todo_snapshots:
-        return []
+        return chapters
 
-    chapters = []
-    completed_todos = set()
-    prev_message_idx = 0
+    completed_todos = {chapter['title'] for chapter in chapters}
+    prev_message_idx = chapters[-1]['completed_at'] if chapters else 0
 
     for snapshot in todo_snapshots:
         for todo in snapshot['todos']:
@@ -141,36 +339,99 @@ def calculate_chapters(todo_snapshots: List[Dict]) -> List[Dict]:
     return chapters
 
 
-def extract_conversation_data(jsonl_file: str) -> Dict[str, Any]:
+def extract_conversation_data(jsonl_file: str,
+                              previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Parse JSONL file and extract structured data:
     - Todo snapshots and chapters
     - Activity signals (files, commands, URLs)
-    - Full text for search (stemmed)
+    - Full text for search (stemmed, with term frequencies and the
+      positions of the messages each stem occurs in)
     - Metadata
-    """
-    entries = parse_jsonl_file(jsonl_file)
+    - Byte offset, message index and user turn of every message line,
+      so readers can seek straight to the messages they need
+
+    The file is streamed line by line through every collector in a single
+    pass, so memory is bounded by the largest line, not the transcript.
 
+    If `previous` is the record from an earlier extraction of the same
+    file and the file has only been appended to since, only the new lines
+    are parsed and folded into it.
+    """
+    started = time.perf_counter()
+    stem_seconds = 0.0
+
+    if previous is not None and not _can_resume(jsonl_file, previous.get('offset', 0)):
+        previous = None
+
+    if previous is not None:
+        reader = JsonlReader(jsonl_file, previous['offset'])
+        chapters = previous['chapters']
+        final_todos = previous['final_todos']
+        message_index = previous['message_count']
+        session_id = previous['session_id'] if previous['session_id'] != 'unknown' else None
+        timestamp = previous['timestamp'] or None
+        user_message_count = previous['user_message_count']
+        first_user_message = previous['first_message'] if user_message_count else None
+        last_user_message = previous['user_message_arc'][-1] if user_message_count else None
+        message_offsets = array('Q', previous['message_offsets'])
+        message_indices = array('I', previous['message_indices'])
+        message_turns = array('I', previous['message_turns'])
+        files_touched = set(previous['files_touched'])
+        commands_run = set(previous['commands_run'])
+        urls_fetched = set(previous['urls_fetched'])
+        term_freqs = Counter(previous['term_freqs'])
+        term_positions = previous['term_positions']
+    else:
+        reader = JsonlReader(jsonl_file)
+        chapters = []
+        final_todos = {'completed': [], 'in_progress': [], 'pending': []}
+        message_index = 0
+        session_id = None
+        timestamp = None
+        user_message_count = 0
+        first_user_message = None
+        last_user_message = None
+        message_offsets = array('Q')
+        message_indices = array('I')
+        message_turns = array('I')
+        files_touched = set()
+        commands_run = set()
+        urls_fetched = set()
+        term_freqs = Counter()
+        term_positions = {}
+
+    user_turn = message_turns[-1] if message_turns else 0
     todo_snapshots = []
-    message_index = 0
-    session_id = None
-    timestamp = None
-    user_messages = []
 
-    for entry in entries:
+    # Skimmed lines aren't searched for a session id, so only skim once it's known
+    reader.skim = bool(session_id)
+
+    for line_offset, entry in reader:
         if 'sessionId' in entry and not session_id:
             session_id = entry['sessionId']
+            reader.skim = bool(session_id)
 
         if entry.get('type') == 'user' and entry.get('message'):
             msg_content = extract_text_content(entry['message'].get('content', ''))
             if msg_content:
-                user_messages.append(msg_content[:200])
+                user_message_count += 1
+                last_user_message = msg_content[:200]
+                if first_user_message is None:
+                    first_user_message = last_user_message
                 if not timestamp:
                     timestamp = entry.get('timestamp')
 
         if entry.get('type') in ['user', 'assistant']:
             message_index += 1
 
+            if entry.get('message'):
+                if entry['type'] == 'user':
+                    user_turn += 1
+                message_offsets.append(line_offset)
+                message_indices.append(message_index)
+                message_turns.append(user_turn)
+
         if entry.get('type') == 'assistant' and entry.get('message'):
             for content_item in entry['message'].get('content', []):
                 if (isinstance(content_item, dict) and
@@ -184,50 +445,70 @@ def extract_conversation_data(jsonl_file: str) -> Dict[str, Any]:
                         'todos': todos
                     })
 
-    # Calculate final state and chapters
-    final_todos = {'completed': [], 'in_progress': [], 'pending': []}
-    chapters = []
-
+        collect_activity(entry, files_touched, commands_run, urls_fetched)
+
+        texts = entry_text_parts(entry)
+        if texts:
+            stem_start = time.perf_counter()
+            # Text only comes from messages, so it belongs to the last one recorded
+            position = len(message_offsets) - 1
+            for text in texts:
+                counts = stem_counts(text)
+                term_freqs.update(counts)
+                for stem in counts:
+                    positions = term_positions.setdefault(stem, [])
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+            stem_seconds += time.perf_counter() - stem_start
+
+    # Calculate final state and chapters (extending any from earlier lines)
     if todo_snapshots:
+        final_todos = {'completed': [], 'in_progress': [], 'pending': []}
         for todo in todo_snapshots[-1]['todos']:
             status = todo.get('status', 'pending')
             content = todo.get('content', '')
             if content:
                 final_todos[status].append(content)
 
-        chapters = calculate_chapters(todo_snapshots)
+        chapters = calculate_chapters(todo_snapshots, chapters)
 
     # User message arc (first + last)
     user_message_arc = []
-    if len(user_messages) > 0:
-        user_message_arc.append(user_messages[0])
-        if len(user_messages) > 1:
-            user_message_arc.append(user_messages[-1])
-
-    # Extract signals and text
-    activity = extract_activity_signals(entries)
-    full_text = extract_full_text(entries)
-    stemmed_terms = stem_text(full_text)
+    if user_message_count > 0:
+        user_message_arc.append(first_user_message)
+        if user_message_count > 1:
+            user_message_arc.append(last_user_message)
 
     all_todos_text = ' '.join(
         final_todos['completed'] + final_todos['in_progress'] + final_todos['pending']
     )
-    stemmed_todos = stem_text(all_todos_text)
+    todo_freqs = stem_counts(all_todos_text)
+
+    metrics.record('extract', time.perf_counter() - started)
+    metrics.record('extract.stem', stem_seconds)
+    metrics.increment('extract.resumed' if previous is not None else 'extract.full')
+    metrics.increment('extract.bytes_read', reader.offset - (previous['offset'] if previous else 0))
+    metrics.increment('extract.lines_read', reader.lines)
 
     return {
         'session_id': session_id or 'unknown',
         'project': os.path.basename(os.path.dirname(jsonl_file)),
-        'first_message': user_messages[0] if user_messages else 'No message',
+        'first_message': first_user_message or 'No message',
         'user_message_arc': user_message_arc,
-        'user_message_count': len(user_messages),
+        'user_message_count': user_message_count,
         'timestamp': timestamp or '',
-        'todo_snapshots': todo_snapshots,
         'final_todos': final_todos,
         'chapters': chapters,
         'message_count': message_index,
-        'files_touched': activity['files_touched'],
-        'commands_run': activity['commands_run'],
-        'urls_fetched': activity['urls_fetched'],
-        'stemmed_terms': stemmed_terms,
-        'stemmed_todos': stemmed_todos,
+        'files_touched': list(files_touched),
+        'commands_run': list(commands_run),
+        'urls_fetched': list(urls_fetched),
+        'term_freqs': dict(term_freqs),
+        'term_positions': term_positions,
+        'todo_freqs': dict(todo_freqs),
+        'doc_length': sum(term_freqs.values()),
+        'offset': reader.offset,
+        'message_offsets': message_offsets,
+        'message_indices': message_indices,
+        'message_turns': message_turns,
     }
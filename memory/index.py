@@ -0,0 +1,263 @@
+"""
+Inverted index over cached conversations.
+
+Maps stems (by vocabulary term id) and lowercased field values back to
+the sessions that contain them, so search only has to score sessions that
+can actually match. Stem postings keep term frequencies and field lengths
+for BM25 ranking.
+"""
+
+import sys
+import math
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Set, List, Iterable, Iterator, Tuple
+
+from .record import SessionRecord, get_vocabulary
+
+
+# Fields indexed by stem (exact posting lookup, with term frequencies)
+STEM_FIELDS = ('todos', 'files', 'text')
+
+# Fields indexed by lowercased value (substring lookup over distinct values)
+VALUE_FIELDS = ('todos', 'files', 'commands', 'messages')
+
+# Value fields whose distinct values are also indexed by trigram, so a
+# substring lookup only verifies values sharing all of the term's trigrams
+TRIGRAM_FIELDS = ('files', 'commands')
+
+# BM25F parameters. Field weights mirror the classic scoring
+# (todos x3, notes x3, files x2, full text x1).
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25F_WEIGHTS = {'todos': 3.0, 'notes': 3.0, 'files': 2.0, 'text': 1.0}
+
+
+def _value_keys(data: SessionRecord, field: str) -> Set[str]:
+    if field == 'todos':
+        values = data.all_todos
+    elif field == 'files':
+        values = data.files_touched
+    elif field == 'commands':
+        values = data.commands_run
+    else:
+        values = data.user_message_arc
+    return {value.lower() for value in values}
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Per-field posting lists.
+
+    stems:   field -> term id -> sorted array of (doc number << 32 | term frequency)
+    values:  field -> lowercased value -> set of session ids
+    grams:   field -> trigram -> distinct lowercased values containing it
+    lengths: field -> session_id -> field length in stems
+
+    Doc numbers are small ints standing in for session ids, so a stem
+    posting costs 8 bytes rather than a dict entry.
+    """
+
+    def __init__(self):
+        self.stems: Dict[str, Dict[int, array]] = {field: {} for field in STEM_FIELDS}
+        self.values: Dict[str, Dict[str, Set[str]]] = {
+            field: defaultdict(set) for field in VALUE_FIELDS
+        }
+        self.grams: Dict[str, Dict[str, Set[str]]] = {
+            field: defaultdict(set) for field in TRIGRAM_FIELDS
+        }
+        self.lengths: Dict[str, Dict[str, int]] = {field: {} for field in STEM_FIELDS}
+        self.total_lengths: Dict[str, int] = {field: 0 for field in STEM_FIELDS}
+        self.doc_numbers: Dict[str, int] = {}
+        self.doc_sessions: List[str] = []
+
+    def _doc_number(self, session_id: str) -> int:
+        doc = self.doc_numbers.get(session_id)
+        if doc is None:
+            doc = self.doc_numbers[session_id] = len(self.doc_sessions)
+            self.doc_sessions.append(session_id)
+        return doc
+
+    def add(self, session_id: str, data: SessionRecord):
+        """Post a session's record under all of its keys"""
+        doc = self._doc_number(session_id)
+        for field in STEM_FIELDS:
+            postings = self.stems[field]
+            for term_id, tf in data.term_freqs(field):
+                entry = doc << 32 | tf
+                docs = postings.get(term_id)
+                if docs is None:
+                    postings[term_id] = array('Q', [entry])
+                elif docs[-1] < entry:
+                    docs.append(entry)
+                else:
+                    docs.insert(bisect_left(docs, entry), entry)
+            length = data.field_length(field)
+            self.lengths[field][session_id] = length
+            self.total_lengths[field] += length
+
+        for field in VALUE_FIELDS:
+            postings = self.values[field]
+            grams = self.grams.get(field)
+            for key in _value_keys(data, field):
+                if grams is not None and key not in postings:
+                    for gram in _trigrams(key):
+                        grams[gram].add(key)
+                postings[key].add(session_id)
+
+    def remove(self, session_id: str, data: SessionRecord):
+        """Remove a session's postings, given the record it was added with"""
+        doc = self.doc_numbers.get(session_id)
+        for field in STEM_FIELDS:
+            postings = self.stems[field]
+            for term_id, _ in data.term_freqs(field):
+                docs = postings.get(term_id)
+                if docs is None or doc is None:
+                    continue
+                i = bisect_left(docs, doc << 32)
+                if i < len(docs) and docs[i] >> 32 == doc:
+                    del docs[i]
+                if not docs:
+                    del postings[term_id]
+            self.total_lengths[field] -= self.lengths[field].pop(session_id, 0)
+
+        for field in VALUE_FIELDS:
+            postings = self.values[field]
+            for key in _value_keys(data, field):
+                sessions = postings.get(key)
+                if sessions is None:
+                    continue
+                sessions.discard(session_id)
+                if not sessions:
+                    del postings[key]
+                    self._drop_trigrams(field, key)
+
+    def _drop_trigrams(self, field: str, key: str):
+        grams = self.grams.get(field)
+        if grams is None:
+            return
+        for gram in _trigrams(key):
+            keys = grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del grams[gram]
+
+    def estimated_size(self) -> int:
+        """Bytes held by the posting lists (session id strings are shared and not counted)"""
+        size = sys.getsizeof(self.doc_numbers) + sys.getsizeof(self.doc_sessions)
+        for postings in (list(self.stems.values()) + list(self.values.values()) +
+                         list(self.grams.values())):
+            size += sys.getsizeof(postings) + sum(map(sys.getsizeof, postings.values()))
+        for lengths in self.lengths.values():
+            size += sys.getsizeof(lengths)
+        return size
+
+    def posting_count(self) -> int:
+        """Number of (stem, session) postings across stemmed fields"""
+        return sum(len(docs) for postings in self.stems.values() for docs in postings.values())
+
+    def postings(self, field: str, stem: str) -> Iterator[Tuple[str, int]]:
+        """(session id, term frequency) for every session whose field contains the stem"""
+        docs = self.stems[field].get(get_vocabulary().lookup(stem), ())
+        sessions = self.doc_sessions
+        for entry in docs:
+            yield sessions[entry >> 32], entry & 0xFFFFFFFF
+
+    def match_stems(self, field: str, stems: Iterable[str]) -> Set[str]:
+        """Sessions whose field contains any of the stems"""
+        matched: Set[str] = set()
+        for stem in stems:
+            matched.update(session_id for session_id, _ in self.postings(field, stem))
+        return matched
+
+    def match_substrings(self, field: str, terms: List[str]) -> Set[str]:
+        """Sessions with a field value containing any of the (lowercased) terms"""
+        matched: Set[str] = set()
+        values = self.values[field]
+        for term in terms:
+            for value in self._values_containing(field, term):
+                matched |= values[value]
+        return matched
+
+    def _values_containing(self, field: str, term: str) -> Iterable[str]:
+        """Distinct values of a field that contain the term"""
+        grams = self.grams.get(field)
+        if grams is None or len(term) < 3:
+            return [value for value in self.values[field] if term in value]
+
+        # Values holding every trigram of the term, smallest posting first
+        postings = sorted((grams.get(gram, ()) for gram in _trigrams(term)), key=len)
+        candidates = set(postings[0])
+        for keys in postings[1:]:
+            if not candidates:
+                break
+            candidates &= keys
+        return [value for value in candidates if term in value]
+
+    def bm25(
+        self,
+        query_stems: Set[str],
+        fields: Iterable[str],
+        note_freqs: Dict[str, Dict[str, int]]
+    ) -> Dict[str, float]:
+        """
+        BM25F scores for every session matching any query stem in the given
+        fields. `note_freqs` maps session ids to stem frequencies over their
+        notes, which are scored as an extra field when 'notes' is among the
+        fields.
+        """
+        doc_count = len(self.lengths['text'])
+        if not doc_count or not query_stems:
+            return {}
+
+        # Notes are posted on the fly for just the query stems
+        note_postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        field_lengths: Dict[str, Dict[str, int]] = {}
+        avg_lengths: Dict[str, float] = {}
+
+        for field in fields:
+            if field == 'notes':
+                field_lengths[field] = {}
+                for session_id, freqs in note_freqs.items():
+                    if session_id not in self.lengths['text']:
+                        continue
+                    for stem in query_stems & freqs.keys():
+                        note_postings[stem][session_id] = freqs[stem]
+                    field_lengths[field][session_id] = sum(freqs.values())
+                total = sum(field_lengths[field].values())
+            else:
+                field_lengths[field] = self.lengths[field]
+                total = self.total_lengths[field]
+            avg_lengths[field] = (total / doc_count) or 1.0
+
+        scores: Dict[str, float] = defaultdict(float)
+
+        for stem in query_stems:
+            # Pseudo term frequency per session, summed over weighted fields
+            pseudo_tf: Dict[str, float] = defaultdict(float)
+            for field in field_lengths:
+                weight = BM25F_WEIGHTS[field]
+                lengths = field_lengths[field]
+                avg_length = avg_lengths[field]
+                if field == 'notes':
+                    postings = note_postings.get(stem, {}).items()
+                else:
+                    postings = self.postings(field, stem)
+                for session_id, tf in postings:
+                    norm = 1 - BM25_B + BM25_B * lengths.get(session_id, 0) / avg_length
+                    pseudo_tf[session_id] += weight * tf / norm
+
+            df = len(pseudo_tf)
+            if not df:
+                continue
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for session_id, tf in pseudo_tf.items():
+                scores[session_id] += idf * tf / (BM25_K1 + tf)
+
+        return scores
@@ -0,0 +1,176 @@
+"""
+Lightweight in-process performance metrics.
+
+Timers keep a call count, total and max, and a latency histogram with
+fixed log-spaced buckets; counters are plain integers. Everything lives in
+module-level dicts behind one lock, so recording costs a dict lookup and
+a few additions. Worker processes record into their own copy, which the
+parent folds back in with merge(drain()).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Any, List, Callable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Histogram bucket upper bounds, in milliseconds (the last bucket is open)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_lock = threading.Lock()
+_started_at = time.time()
+
+# name -> [count, total seconds, max seconds, bucket counts...]
+_timers: Dict[str, List[float]] = {}
+_counters: Dict[str, int] = {}
+
+
+def record(name: str, seconds: float):
+    """Add one timing to a timer"""
+    bucket = bisect_left(BUCKETS_MS, seconds * 1000)
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = [0, 0.0, 0.0] + [0] * (len(BUCKETS_MS) + 1)
+        timer[0] += 1
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+        timer[3 + bucket] += 1
+
+
+def increment(name: str, amount: int = 1):
+    """Add to a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Time the enclosed block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function or coroutine function"""
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with timer(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with timer(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def drain() -> Dict[str, Any]:
+    """Take and reset everything recorded so far (raw form, for merge)"""
+    global _timers, _counters
+    with _lock:
+        raw = {'timers': _timers, 'counters': _counters}
+        _timers, _counters = {}, {}
+    return raw
+
+
+def merge(raw: Dict[str, Any]):
+    """Fold in metrics drained from another process"""
+    with _lock:
+        for name, other in raw['timers'].items():
+            timer = _timers.get(name)
+            if timer is None:
+                _timers[name] = list(other)
+                continue
+            timer[0] += other[0]
+            timer[1] += other[1]
+            timer[2] = max(timer[2], other[2])
+            for i in range(3, len(timer)):
+                timer[i] += other[i]
+        for name, amount in raw['counters'].items():
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def _percentile(buckets: List[int], count: int, p: float) -> Optional[float]:
+    """Upper bound (ms) of the bucket holding the p-th percentile (None: open bucket)"""
+    target = p * count
+    seen = 0
+    for bound, n in zip(BUCKETS_MS, buckets):
+        seen += n
+        if seen >= target:
+            return bound
+    return None
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Everything recorded so far, summarized. Percentiles are bucket upper
+    bounds, so read them as "at most".
+    """
+    with _lock:
+        timers = {name: list(timer) for name, timer in _timers.items()}
+        counters = dict(_counters)
+
+    summary = {}
+    for name, timer in sorted(timers.items()):
+        count, total, longest, buckets = int(timer[0]), timer[1], timer[2], timer[3:]
+        labels = [f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        summary[name] = {
+            'count': count,
+            'totalMs': round(total * 1000, 3),
+            'meanMs': round(total * 1000 / count, 3) if count else 0.0,
+            'maxMs': round(longest * 1000, 3),
+            'p50Ms': _percentile(buckets, count, 0.50),
+            'p90Ms': _percentile(buckets, count, 0.90),
+            'p99Ms': _percentile(buckets, count, 0.99),
+            'histogram': {label: int(n) for label, n in zip(labels, buckets) if n},
+        }
+
+    return {
+        'uptimeSeconds': round(time.time() - _started_at, 1),
+        'timers': summary,
+        'counters': dict(sorted(counters.items())),
+    }
+
+
+def process_memory() -> Dict[str, int]:
+    """Current and peak resident set size of this process, where the OS reports them"""
+    memory = {}
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        memory['peakRssBytes'] = peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open('/proc/self/statm') as f:
+            memory['rssBytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    return memory
+
+
+def dump(path: str, stats: Dict[str, Any]):
+    """Append stats to a log file as one JSON line"""
+    try:
+        with open(path, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'pid': os.getpid(), **stats},
+                               default=str) + '\n')
+    except Exception as e:
+        print(f"Error writing metrics: {e}", file=sys.stderr)
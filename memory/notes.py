@@ -1,52 +1,196 @@
 """
 Notes storage - breadcrumbs left on sessions for future searches.
+
+Notes live in two files: the compacted notes JSON at NOTES_PATH (session id
+-> list of notes) and an append-only log next to it with one JSON line per
+note added since the last compaction. Adding a note appends one line;
+load_notes() only reads what was appended since it last looked, and only
+re-reads everything when another process compacted the log. Appends and
+compaction take an exclusive flock on the log and reads a shared one, so
+several servers can add notes at once.
 """
 
 import os
+import sys
 import json
-from typing import Dict, List
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Set, Optional, Tuple, BinaryIO, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from . import NOTES_PATH
+from .stemmer import stem_counts
+
 
+NOTES_LOG_PATH = NOTES_PATH + '.log'
+
+# Fold the log into the notes JSON once it grows past this
+COMPACT_BYTES = 64 * 1024
 
 # In-memory cache
 _notes_cache: Dict[str, List[str]] = {}
 
+# Lowercased whitespace-separated note token -> sessions with a note containing it
+_note_tokens: Dict[str, Set[str]] = defaultdict(set)
 
-def load_notes():
-    """Load notes from disk"""
-    global _notes_cache
+# Session -> stem frequencies over all of its notes (for BM25)
+_note_freqs: Dict[str, Counter] = {}
+
+# (mtime_ns, size) of the notes JSON as loaded, and how much of the log is applied
+_base_stamp: Optional[Tuple[int, int]] = None
+_log_offset = 0
+
+# Held while notes are loaded or added; readers walking the notes from
+# tool threads hold it too
+_lock = threading.RLock()
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
     try:
-        if os.path.exists(NOTES_PATH):
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+@contextmanager
+def _locked_log(exclusive: bool) -> Iterator[BinaryIO]:
+    """Open the log (creating it) under a shared or exclusive flock"""
+    with open(NOTES_LOG_PATH, 'a+b') as log:
+        if fcntl is not None:
+            fcntl.flock(log, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield log
+
+
+def _apply(session_id: str, note: str):
+    _notes_cache.setdefault(session_id, []).append(note)
+    for token in note.lower().split():
+        _note_tokens[token].add(session_id)
+    _note_freqs.setdefault(session_id, Counter()).update(stem_counts(note))
+
+
+def _reset():
+    global _log_offset
+    _notes_cache.clear()
+    _note_tokens.clear()
+    _note_freqs.clear()
+    _log_offset = 0
+
+
+def _sync(log: BinaryIO):
+    """Catch up with the notes JSON and log. Call with the log locked."""
+    global _base_stamp, _log_offset
+
+    log.seek(0, os.SEEK_END)
+    base_stamp = _stamp(NOTES_PATH)
+    if base_stamp != _base_stamp or log.tell() < _log_offset:
+        # Compacted since we last looked: start over from the new notes JSON
+        _reset()
+        if base_stamp is not None:
             with open(NOTES_PATH, 'r') as f:
-                _notes_cache = json.load(f)
-    except Exception as e:
-        print(f"Error loading notes: {e}")
-        _notes_cache = {}
+                for session_id, notes in json.load(f).items():
+                    for note in notes:
+                        _apply(session_id, note)
+        _base_stamp = base_stamp
 
+    log.seek(_log_offset)
+    appended = log.read()
+    # Only whole lines; a partial one is finished by the next append
+    appended = appended[:appended.rfind(b'\n') + 1]
+    for line in appended.splitlines():
+        try:
+            entry = json.loads(line)
+            _apply(entry['sessionId'], entry['note'])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error loading note: {e}", file=sys.stderr)
+    _log_offset += len(appended)
+
+
+def _compact(log: BinaryIO):
+    """Fold the log into the notes JSON. Call with the log exclusively locked and synced."""
+    global _base_stamp, _log_offset
+
+    tmp_path = NOTES_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_notes_cache, f, indent=2)
+    os.replace(tmp_path, NOTES_PATH)
+    # Dying right here leaves the log's notes in both files (duplicated on the
+    # next load), never in neither
+    log.truncate(0)
+    _base_stamp = _stamp(NOTES_PATH)
+    _log_offset = 0
+
+
+def load_notes():
+    """Pick up notes added since the last call, by this or another process"""
+    with _lock:
+        log_stamp = _stamp(NOTES_LOG_PATH)
+        log_size = log_stamp[1] if log_stamp else 0
+        if _stamp(NOTES_PATH) == _base_stamp and log_size == _log_offset:
+            return
+        try:
+            with _locked_log(exclusive=False) as log:
+                _sync(log)
+        except Exception as e:
+            print(f"Error loading notes: {e}", file=sys.stderr)
 
-def save_notes():
-    """Save notes to disk"""
-    try:
-        with open(NOTES_PATH, 'w') as f:
-            json.dump(_notes_cache, f, indent=2)
-    except Exception as e:
-        print(f"Error saving notes: {e}")
+
+def notes_lock() -> threading.RLock:
+    """Lock to hold while walking the notes (e.g. get_note_freqs)"""
+    return _lock
+
+
+def get_all_notes() -> Dict[str, List[str]]:
+    """Get notes for every session"""
+    return _notes_cache
+
+
+def get_note_freqs() -> Dict[str, Counter]:
+    """Get stem frequencies over each session's notes"""
+    return _note_freqs
 
 
 def get_notes_for_session(session_id: str) -> List[str]:
     """Get notes for a specific session"""
-    return _notes_cache.get(session_id, [])
+    with _lock:
+        return list(_notes_cache.get(session_id, ()))
+
+
+def find_sessions_with_notes(terms: List[str]) -> Set[str]:
+    """Sessions with a note containing any of the (lowercased, whitespace-free) terms"""
+    # A term without whitespace can only occur inside a single note token
+    matched = set()
+    with _lock:
+        for token, sessions in _note_tokens.items():
+            if any(term in token for term in terms):
+                matched |= sessions
+    return matched
 
 
 def add_note_to_session(session_id: str, note: str) -> int:
     """Add a note to a session, returns total notes count"""
-    load_notes()
-
-    if session_id not in _notes_cache:
-        _notes_cache[session_id] = []
+    line = json.dumps({'sessionId': session_id, 'note': note}) + '\n'
 
-    _notes_cache[session_id].append(note)
-    save_notes()
+    with _lock:
+        try:
+            with _locked_log(exclusive=True) as log:
+                # Don't run on from a line a crashed writer left unfinished
+                log.seek(0, os.SEEK_END)
+                if log.tell():
+                    log.seek(-1, os.SEEK_END)
+                    if log.read(1) != b'\n':
+                        line = '\n' + line
+                log.write(line.encode('utf-8'))
+                log.flush()
+                _sync(log)
+                if _log_offset >= COMPACT_BYTES:
+                    _compact(log)
+        except Exception as e:
+            print(f"Error saving notes: {e}", file=sys.stderr)
 
-    return len(_notes_cache[session_id])
+        return len(_notes_cache.get(session_id, []))
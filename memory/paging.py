@@ -0,0 +1,70 @@
+"""
+Cursor pagination for the list and search tools.
+
+A search ranks every match once as light (score, timestamp, session_id)
+tuples and keeps the ranking here under a random token; responses are only
+built for the page returned. The cursor handed back is opaque to callers
+but carries the token, where the next page starts and the tool arguments,
+so the next page is cut from the kept ranking, or ranked again from the
+arguments if it has been evicted (or another server issued the cursor).
+"""
+
+import os
+import json
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple
+
+
+# Rankings kept for paging; the least recently used are dropped first
+MAX_RANKINGS = 32
+
+Ranking = List[Tuple[float, str, str]]
+
+_rankings: 'OrderedDict[str, Ranking]' = OrderedDict()
+_lock = threading.Lock()
+
+
+class Cursor(NamedTuple):
+    token: Optional[str]
+    offset: int
+    args: Dict[str, Any]
+
+
+def encode_cursor(token: Optional[str], offset: int, args: Dict[str, Any]) -> str:
+    payload = json.dumps({'t': token, 'o': offset, 'a': args}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Cursor]:
+    """The cursor's contents, or None if it isn't one of ours"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        offset = payload['o']
+        if not isinstance(offset, int) or offset < 0 or not isinstance(payload['a'], dict):
+            return None
+        return Cursor(payload['t'], offset, payload['a'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def get_ranking(token: Optional[str]) -> Optional[Ranking]:
+    if token is None:
+        return None
+    with _lock:
+        ranking = _rankings.get(token)
+        if ranking is not None:
+            _rankings.move_to_end(token)
+        return ranking
+
+
+def keep_ranking(token: Optional[str], ranking: Ranking) -> str:
+    """Keep a ranking for later pages, returning its token (a new one if None)"""
+    token = token or os.urandom(8).hex()
+    with _lock:
+        _rankings[token] = ranking
+        _rankings.move_to_end(token)
+        while len(_rankings) > MAX_RANKINGS:
+            _rankings.popitem(last=False)
+    return token
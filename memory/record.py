@@ -0,0 +1,325 @@
+"""
+Compact in-memory form of a cached session.
+
+Extraction produces plain dicts; the cache keeps each session as a
+SessionRecord instead. Stems are interned into one global vocabulary and
+stored as sorted array('I') term ids with parallel term frequencies and
+the positions of the messages each term occurs in, and repeated strings
+(projects, file paths, commands) are interned, so a long history stays
+resident without a dict and a string per term per session.
+"""
+
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Any, List, Tuple, Iterable, Iterator, Optional, NamedTuple
+
+from .stemmer import stem_counts
+
+
+class Vocabulary:
+    """Stems <-> dense integer term ids, shared by every record"""
+
+    def __init__(self):
+        self.terms: List[str] = []
+        self.ids: Dict[str, int] = {}
+        # New terms can arrive from several tool threads at once (sqlite backend)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def intern(self, term: str) -> int:
+        term_id = self.ids.get(term)
+        if term_id is None:
+            with self._lock:
+                term_id = self.ids.get(term)
+                if term_id is None:
+                    term_id = len(self.terms)
+                    term = sys.intern(term)
+                    self.terms.append(term)
+                    self.ids[term] = term_id
+        return term_id
+
+    def estimated_size(self) -> int:
+        return (sys.getsizeof(self.terms) + sys.getsizeof(self.ids) +
+                sum(sys.getsizeof(term) for term in self.terms))
+
+    def lookup(self, term: str) -> Optional[int]:
+        """Id of a known stem, or None if no session contains it"""
+        return self.ids.get(term)
+
+
+_vocabulary = Vocabulary()
+
+
+def get_vocabulary() -> Vocabulary:
+    """Get the global term vocabulary"""
+    return _vocabulary
+
+
+def load_vocabulary(terms: List[str]) -> Optional[array]:
+    """
+    Intern a persisted vocabulary. Returns a table mapping its ids to ours,
+    or None if they already agree (the usual case for a fresh process).
+    """
+    table = array('I', (_vocabulary.intern(term) for term in terms))
+    if all(new == old for old, new in enumerate(table)):
+        return None
+    return table
+
+
+def _pack(freqs: Dict[str, int]) -> Tuple[array, array]:
+    """Term frequencies as sorted (term ids, counts) arrays"""
+    pairs = sorted((_vocabulary.intern(term), count) for term, count in freqs.items())
+    return array('I', [term_id for term_id, _ in pairs]), array('I', [count for _, count in pairs])
+
+
+def _unpack(ids: array, counts: array) -> Dict[str, int]:
+    terms = _vocabulary.terms
+    return {terms[term_id]: count for term_id, count in zip(ids, counts)}
+
+
+def _pack_locations(term_ids: array, positions: Dict[str, List[int]]) -> Tuple[array, array]:
+    """
+    Message positions per term, concatenated in term id order: the positions
+    of term_ids[i] are locations[starts[i]:starts[i + 1]]. Positions are
+    16-bit unless the session has more messages than that.
+    """
+    terms = _vocabulary.terms
+    starts = array('I', [0])
+    locations = array('I')
+    for term_id in term_ids:
+        locations.extend(positions.get(terms[term_id], ()))
+        starts.append(len(locations))
+    if not locations or max(locations) <= 0xFFFF:
+        locations = array('H', locations)
+    return starts, locations
+
+
+def _interned(values: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sys.intern(value) for value in values)
+
+
+class Chapter(NamedTuple):
+    """A phase of work ended by a completed todo, over messages [start, end)"""
+    title: str
+    start: int
+    end: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'title': self.title,
+            'message_range': (self.start, self.end),
+            'completed_at': self.end,
+            'message_count': self.end - self.start
+        }
+
+
+def _best_hits(matched: Dict[int, int], limit: int) -> List[Tuple[int, int]]:
+    """(message position, stems matched) pairs, most matches first, then earliest"""
+    return sorted(matched.items(), key=lambda hit: (-hit[1], hit[0]))[:limit]
+
+
+class SessionRecord:
+    """One indexed session, as kept in the conversation cache"""
+
+    __slots__ = (
+        'session_id', 'project', 'file_path', 'mtime', 'size', 'offset',
+        'first_message', 'user_message_arc', 'user_message_count', 'message_count',
+        'timestamp', 'chapters', 'completed', 'in_progress', 'pending',
+        'files_touched', 'commands_run', 'urls_fetched',
+        'term_ids', 'term_counts', 'location_starts', 'locations', 'doc_length',
+        'todo_ids', 'todo_counts',
+        'file_ids', 'file_counts',
+        'message_offsets', 'message_indices', 'message_turns',
+    )
+
+    @classmethod
+    def from_extracted(cls, data: Dict[str, Any], file_path: str, mtime: float,
+                       size: int) -> 'SessionRecord':
+        """Build a record from extract_conversation_data output"""
+        record = cls._plain(data, file_path, mtime, size)
+        record.term_ids, record.term_counts = _pack(data['term_freqs'])
+        record.location_starts, record.locations = _pack_locations(record.term_ids,
+                                                                   data['term_positions'])
+        record.todo_ids, record.todo_counts = _pack(data['todo_freqs'])
+        record.file_ids, record.file_counts = _pack(stem_counts(' '.join(record.files_touched)))
+        return record
+
+    @classmethod
+    def _plain(cls, data: Dict[str, Any], file_path: str, mtime: float,
+               size: int) -> 'SessionRecord':
+        """A record with every field but the term id arrays filled in"""
+        record = cls()
+        record.session_id = data['session_id']
+        record.project = sys.intern(data['project'])
+        record.file_path = file_path
+        record.mtime = mtime
+        record.size = size
+        record.offset = data['offset']
+        record.first_message = data['first_message']
+        record.user_message_arc = tuple(data['user_message_arc'])
+        record.user_message_count = data['user_message_count']
+        record.message_count = data['message_count']
+        record.timestamp = data['timestamp']
+        record.chapters = tuple(Chapter(c['title'], *c['message_range'])
+                                for c in data['chapters'])
+        record.completed = tuple(data['final_todos']['completed'])
+        record.in_progress = tuple(data['final_todos']['in_progress'])
+        record.pending = tuple(data['final_todos']['pending'])
+        record.files_touched = _interned(data['files_touched'])
+        record.commands_run = _interned(data['commands_run'])
+        record.urls_fetched = _interned(data['urls_fetched'])
+        record.doc_length = data['doc_length']
+        record.message_offsets = data['message_offsets']
+        record.message_indices = data['message_indices']
+        record.message_turns = data['message_turns']
+        return record
+
+    def extraction_state(self) -> Dict[str, Any]:
+        """This record in extract_conversation_data's shape, to resume extraction from"""
+        terms = _vocabulary.terms
+        return {
+            'session_id': self.session_id,
+            'first_message': self.first_message,
+            'user_message_arc': list(self.user_message_arc),
+            'user_message_count': self.user_message_count,
+            'timestamp': self.timestamp,
+            'final_todos': {'completed': list(self.completed),
+                            'in_progress': list(self.in_progress),
+                            'pending': list(self.pending)},
+            'chapters': [chapter.as_dict() for chapter in self.chapters],
+            'message_count': self.message_count,
+            'files_touched': list(self.files_touched),
+            'commands_run': list(self.commands_run),
+            'urls_fetched': list(self.urls_fetched),
+            'term_freqs': _unpack(self.term_ids, self.term_counts),
+            'term_positions': {terms[term_id]: list(self.term_locations(i))
+                               for i, term_id in enumerate(self.term_ids)},
+            'offset': self.offset,
+            'message_offsets': self.message_offsets,
+            'message_indices': self.message_indices,
+            'message_turns': self.message_turns,
+        }
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def all_todos(self) -> Tuple[str, ...]:
+        return self.completed + self.in_progress + self.pending
+
+    def term_freqs(self, field: str) -> Iterator[Tuple[int, int]]:
+        """(term id, frequency) pairs of a stemmed field: 'todos', 'files' or 'text'"""
+        if field == 'todos':
+            return zip(self.todo_ids, self.todo_counts)
+        if field == 'files':
+            return zip(self.file_ids, self.file_counts)
+        return zip(self.term_ids, self.term_counts)
+
+    def field_length(self, field: str) -> int:
+        if field == 'todos':
+            return sum(self.todo_counts)
+        if field == 'files':
+            return sum(self.file_counts)
+        return self.doc_length
+
+    def count_stems(self, field: str, stems: Iterable[str]) -> int:
+        """How many of the stems occur in a stemmed field"""
+        ids = self.todo_ids if field == 'todos' else self.file_ids if field == 'files' else self.term_ids
+        found = 0
+        for stem in stems:
+            term_id = _vocabulary.lookup(stem)
+            if term_id is None:
+                continue
+            i = bisect_left(ids, term_id)
+            if i < len(ids) and ids[i] == term_id:
+                found += 1
+        return found
+
+    def term_locations(self, i: int) -> array:
+        """Positions of the messages containing the i-th term of term_ids"""
+        return self.locations[self.location_starts[i]:self.location_starts[i + 1]]
+
+    def message_hits(self, stems: Iterable[str], limit: int) -> List[Tuple[int, int]]:
+        """
+        (message position, distinct stems matched) of the messages whose text
+        contains the most of the stems, earliest first among equals
+        """
+        ids = self.term_ids
+        matched: Dict[int, int] = {}
+        for stem in stems:
+            term_id = _vocabulary.lookup(stem)
+            if term_id is None:
+                continue
+            i = bisect_left(ids, term_id)
+            if i < len(ids) and ids[i] == term_id:
+                for position in self.term_locations(i):
+                    matched[position] = matched.get(position, 0) + 1
+        return _best_hits(matched, limit)
+
+    def estimated_size(self) -> int:
+        """Bytes held by this record's own containers (shared strings not counted)"""
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, name))
+                                         for name in self.__slots__
+                                         if isinstance(getattr(self, name), (array, tuple)))
+
+    def remap(self, table: array):
+        """Translate term ids after loading under a different vocabulary"""
+        # Text terms carry their message locations along when re-sorted
+        terms = sorted((table[term_id], count, self.term_locations(i))
+                       for i, (term_id, count) in enumerate(zip(self.term_ids, self.term_counts)))
+        self.term_ids = array('I', [term_id for term_id, _, _ in terms])
+        self.term_counts = array('I', [count for _, count, _ in terms])
+        self.location_starts = array('I', [0])
+        self.locations = array(self.locations.typecode)
+        for _, _, locations in terms:
+            self.locations.extend(locations)
+            self.location_starts.append(len(self.locations))
+
+        for ids_name, counts_name in (('todo_ids', 'todo_counts'), ('file_ids', 'file_counts')):
+            pairs = sorted(zip((table[term_id] for term_id in getattr(self, ids_name)),
+                               getattr(self, counts_name)))
+            setattr(self, ids_name, array('I', [term_id for term_id, _ in pairs]))
+            setattr(self, counts_name, array('I', [count for _, count in pairs]))
+
+
+class StoredRecord(SessionRecord):
+    """
+    A session read back from the SQLite store for one tool response. Its
+    stems stay plain strings instead of term ids, so serving results doesn't
+    grow the process-wide vocabulary; the term id arrays are left empty.
+    """
+
+    __slots__ = ('stems', 'term_positions')
+
+    @classmethod
+    def from_extracted(cls, data: Dict[str, Any], file_path: str, mtime: float,
+                       size: int) -> 'StoredRecord':
+        record = cls._plain(data, file_path, mtime, size)
+        for name in ('term_ids', 'term_counts', 'location_starts',
+                     'todo_ids', 'todo_counts', 'file_ids', 'file_counts'):
+            setattr(record, name, array('I'))
+        record.locations = array('H')
+        record.stems = {'todos': data['todo_freqs'].keys(),
+                        'files': stem_counts(' '.join(record.files_touched)).keys(),
+                        'text': data['term_freqs'].keys()}
+        record.term_positions = data['term_positions']
+        return record
+
+    def count_stems(self, field: str, stems: Iterable[str]) -> int:
+        present = self.stems.get(field, self.stems['text'])
+        return sum(1 for stem in stems if stem in present)
+
+    def message_hits(self, stems: Iterable[str], limit: int) -> List[Tuple[int, int]]:
+        matched: Dict[int, int] = {}
+        for stem in stems:
+            for position in self.term_positions.get(stem, ()):
+                matched[position] = matched.get(position, 0) + 1
+        return _best_hits(matched, limit)
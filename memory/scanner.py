@@ -0,0 +1,157 @@
+"""
+Change detection for session files under the projects root.
+
+A project directory's mtime only moves when files are created, removed or
+renamed in it, not when an existing session is appended to. So each sweep:
+- lists (scandir) only directories whose mtime changed, to find new and
+  deleted sessions
+- re-stats only recently active sessions in unchanged directories, since
+  those are the ones still being appended to
+- falls back to a full listing every FULL_SWEEP_INTERVAL seconds to catch
+  appends to long-idle sessions
+
+A sweep can be limited to some project directories (a shard of the index);
+the others are left as they were, to be caught up by a later sweep.
+"""
+
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple, Iterable
+
+
+# Sessions modified within this window are re-stat'ed on every sweep
+ACTIVE_WINDOW = 24 * 3600.0
+
+# Seconds between sweeps that list and stat everything
+FULL_SWEEP_INTERVAL = 300.0
+
+# file path -> stat result, for new or modified session files
+Changes = Dict[str, os.stat_result]
+
+
+class ProjectScanner:
+    def __init__(self, root: str):
+        self.root = root
+        self.root_mtime: Optional[int] = None
+        self.dir_mtimes: Dict[str, int] = {}
+        # project dir -> session file path -> (mtime, size)
+        self.files: Dict[str, Dict[str, Tuple[float, int]]] = {}
+        # files to re-stat next sweep regardless of activity (failed to index)
+        self.retry: Set[str] = set()
+        self.last_full_sweep = 0.0
+        # project dir -> when its sessions were last all listed and stat'ed
+        self.dir_swept: Dict[str, float] = {}
+        self.project_dirs: List[str] = []
+
+    def scan(self, project_dirs: Optional[Iterable[str]] = None) -> Tuple[Changes, List[str]]:
+        """
+        Return (new or modified files with their stat, deleted files), across
+        all project directories or only the given ones
+        """
+        changed: Changes = {}
+        removed: List[str] = []
+        now = time.time()
+        full = now - self.last_full_sweep >= FULL_SWEEP_INTERVAL
+
+        if project_dirs is not None:
+            dirs = list(project_dirs)
+        else:
+            dirs = self.list_project_dirs(relist=full)
+            for gone in set(self.files) - set(dirs):
+                removed.extend(self.files.pop(gone))
+                self.dir_mtimes.pop(gone, None)
+                self.dir_swept.pop(gone, None)
+
+        for project_dir in dirs:
+            try:
+                dir_mtime = os.stat(project_dir).st_mtime_ns
+            except OSError:
+                removed.extend(self.files.pop(project_dir, {}))
+                self.dir_mtimes.pop(project_dir, None)
+                self.dir_swept.pop(project_dir, None)
+                continue
+
+            if (now - self.dir_swept.get(project_dir, 0.0) >= FULL_SWEEP_INTERVAL or
+                    self.dir_mtimes.get(project_dir) != dir_mtime):
+                self._list_sessions(project_dir, changed, removed)
+                self.dir_mtimes[project_dir] = dir_mtime
+                self.dir_swept[project_dir] = now
+                self.retry.difference_update(self.files.get(project_dir, ()))
+            else:
+                self._restat_active(project_dir, now, changed, removed)
+
+        if project_dirs is None and full:
+            self.last_full_sweep = now
+
+        return changed, removed
+
+    def forget(self, file_path: str):
+        """Make the next sweep report this file again (e.g. it failed to index)"""
+        known = self.files.get(os.path.dirname(file_path), {})
+        if file_path in known:
+            known[file_path] = (-1.0, -1)
+            self.retry.add(file_path)
+
+    def list_project_dirs(self, relist: bool = False) -> List[str]:
+        """Project directories under the root, re-listed when the root changed (or asked to)"""
+        try:
+            root_mtime = os.stat(self.root).st_mtime_ns
+        except OSError:
+            root_mtime = None
+        if not relist and root_mtime is not None and root_mtime == self.root_mtime:
+            return list(self.project_dirs)
+
+        dirs = []
+        try:
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if not entry.name.startswith('.') and entry.is_dir():
+                        dirs.append(entry.path)
+        except OSError:
+            pass
+        self.project_dirs = dirs
+        self.root_mtime = root_mtime
+        return list(dirs)
+
+    def _list_sessions(self, project_dir: str, changed: Changes, removed: List[str]):
+        known = self.files.get(project_dir, {})
+        current: Dict[str, Tuple[float, int]] = {}
+
+        try:
+            with os.scandir(project_dir) as entries:
+                for entry in entries:
+                    if (not entry.name.endswith('.jsonl') or entry.name.startswith('.') or
+                            not entry.is_file()):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    current[entry.path] = (st.st_mtime, st.st_size)
+                    if known.get(entry.path) != current[entry.path]:
+                        changed[entry.path] = st
+        except OSError:
+            # Keep what we knew rather than reporting everything as deleted
+            return
+
+        removed.extend(path for path in known if path not in current)
+        self.files[project_dir] = current
+
+    def _restat_active(self, project_dir: str, now: float, changed: Changes, removed: List[str]):
+        known = self.files.get(project_dir, {})
+
+        for path, (mtime, size) in list(known.items()):
+            if now - mtime > ACTIVE_WINDOW and path not in self.retry:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del known[path]
+                removed.append(path)
+                continue
+            except OSError:
+                continue
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                known[path] = (st.st_mtime, st.st_size)
+                changed[path] = st
+                self.retry.discard(path)
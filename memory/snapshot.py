@@ -0,0 +1,128 @@
+"""
+On-disk snapshot of extracted conversation data for warm starts.
+
+One file per project directory (a shard of the index) under SHARD_DIR, so
+a shard is only read when that project is first refreshed, and saving the
+active project doesn't rewrite every other one. Records carry the mtime
+and size they were extracted at, so a fresh process only re-parses files
+that changed. Each shard stores the vocabulary its records' term ids refer
+to, numbered for that shard alone; the stemmer's memo is kept in a file
+of its own.
+"""
+
+import os
+import sys
+import copy
+import pickle
+from array import array
+from typing import Dict, Any
+
+from . import INDEX_PATH
+from .record import SessionRecord, get_vocabulary, load_vocabulary
+from .stemmer import get_stem_cache, load_stem_cache
+
+
+# Bump whenever the shape of extracted records changes
+SNAPSHOT_VERSION = 6
+
+SHARD_DIR = os.path.splitext(INDEX_PATH)[0] + '.shards'
+STEMS_PATH = os.path.join(SHARD_DIR, '.stems.pickle')
+
+
+def _shard_path(project: str) -> str:
+    return os.path.join(SHARD_DIR, f'{project}.pickle')
+
+
+def _load(path: str) -> Any:
+    """A snapshot file's payload, or None if missing, unreadable or stale"""
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading index snapshot: {e}", file=sys.stderr)
+        return None
+
+    if not isinstance(payload, dict) or payload.get('version') != SNAPSHOT_VERSION:
+        return None
+    return payload
+
+
+def _save(path: str, payload: Dict[str, Any]):
+    """Atomically write a snapshot file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(dict(payload, version=SNAPSHOT_VERSION), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving index snapshot: {e}", file=sys.stderr)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_stems():
+    """Seed the stemmer's memo with the persisted word -> stem table"""
+    payload = _load(STEMS_PATH)
+    if payload is not None:
+        load_stem_cache(payload.get('stems', {}))
+
+
+def save_stems():
+    # Copied first: tool threads may stem new words meanwhile
+    _save(STEMS_PATH, {'stems': dict(get_stem_cache())})
+
+
+def load_snapshot(project: str) -> Dict[str, SessionRecord]:
+    """
+    Load a project's records from disk, keyed by file path (empty if missing
+    or stale), interning its vocabulary and translating term ids to ours
+    """
+    payload = _load(_shard_path(project))
+    if payload is None:
+        return {}
+
+    records = payload.get('records', {})
+    table = load_vocabulary(payload.get('vocabulary', []))
+    if table is not None:
+        for record in records.values():
+            record.remap(table)
+    return records
+
+
+def save_snapshot(project: str, records: Dict[str, SessionRecord]):
+    """
+    Atomically write a project's records (keyed by file path), with term ids
+    renumbered over just the terms they use
+    """
+    terms = get_vocabulary().terms
+    used = sorted({term_id for record in records.values()
+                   for ids in (record.term_ids, record.todo_ids, record.file_ids)
+                   for term_id in ids})
+    table = array('I', bytes(4 * (max(used) + 1) if used else 0))
+    for local_id, term_id in enumerate(used):
+        table[term_id] = local_id
+
+    local: Dict[str, SessionRecord] = {}
+    for file_path, record in records.items():
+        # remap() replaces the id arrays rather than editing them, so a
+        # shallow copy leaves the cached record untouched
+        local[file_path] = copy.copy(record)
+        local[file_path].remap(table)
+
+    _save(_shard_path(project), {'records': local,
+                                 'vocabulary': [terms[term_id] for term_id in used]})
+
+
+def remove_snapshot(project: str):
+    """Delete the shard of a project directory that no longer exists"""
+    try:
+        os.remove(_shard_path(project))
+    except OSError:
+        pass
+
@@ -6,7 +6,9 @@ e.g., "implementing" -> "implement", "implemented" -> "implement"
 """
 
 import re
-from typing import Set
+from collections import Counter
+from itertools import islice
+from typing import Dict, Set
 
 
 class PorterStemmer:
@@ -158,11 +160,70 @@ class PorterStemmer:
 # Global instance
 _stemmer = PorterStemmer()
 
+# Word -> stem memo shared by stem_text and stem_query. Natural-language
+# vocabulary is small next to token counts, so most lookups hit; the bound
+# keeps odd identifiers and noise from growing it without limit.
+STEM_CACHE_SIZE = 100_000
+_stem_cache: Dict[str, str] = {}
+
+# Words that went through the Porter algorithm (memo misses), for metrics
+_stem_misses = 0
+
+# How much of the memo take_new_stems has already handed out
+_stems_taken = 0
+
+
+def stem_word(word: str) -> str:
+    """Stem a single lowercase word, memoized"""
+    global _stem_misses
+
+    stem = _stem_cache.get(word)
+    if stem is None:
+        _stem_misses += 1
+        stem = _stemmer.stem(word)
+        if len(_stem_cache) < STEM_CACHE_SIZE:
+            _stem_cache[word] = stem
+    return stem
+
+
+def get_stem_cache() -> Dict[str, str]:
+    """Get the word -> stem memo (for persisting)"""
+    return _stem_cache
+
+
+def take_new_stems() -> Dict[str, str]:
+    """Memo entries added since the last call (a worker's, to send back to the parent)"""
+    global _stems_taken
+
+    new = dict(islice(_stem_cache.items(), _stems_taken, None))
+    _stems_taken = len(_stem_cache)
+    return new
+
+
+def stem_cache_stats() -> Dict[str, int]:
+    """Memo size and misses in this process"""
+    return {'memoSize': len(_stem_cache), 'memoCapacity': STEM_CACHE_SIZE,
+            'misses': _stem_misses}
+
+
+def load_stem_cache(entries: Dict[str, str]):
+    """Seed the word -> stem memo from a persisted copy"""
+    for word, stem in entries.items():
+        if len(_stem_cache) >= STEM_CACHE_SIZE:
+            break
+        _stem_cache.setdefault(word, stem)
+
 
 def stem_text(text: str) -> Set[str]:
     """Extract and stem all words from text"""
     words = re.findall(r'\b[a-zA-Z]+\b', text.lower())
-    return {_stemmer.stem(word) for word in words if len(word) > 2}
+    return {stem_word(word) for word in words if len(word) > 2}
+
+
+def stem_counts(text: str) -> Dict[str, int]:
+    """Extract and stem all words from text, keeping how often each stem occurs"""
+    words = re.findall(r'\b[a-zA-Z]+\b', text.lower())
+    return Counter(stem_word(word) for word in words if len(word) > 2)
 
 
 def stem_query(query: str) -> Set[str]:
@@ -0,0 +1,334 @@
+"""
+SQLite storage backend for the index (CLAUDE_MEMORY_BACKEND=sqlite).
+
+Sessions live in a WAL-mode database at DB_PATH instead of this process's
+memory, so the index survives restarts and every server process shares it.
+Plain indexed tables hold what filters and sorts need (project, start time,
+chapters); FTS5 tables hold what search matches:
+
+    session_fields  todos, files and commands as written (porter tokenizer)
+    session_substrings  the same again (trigram tokenizer), for the substring
+                    matches the in-memory backend makes on them
+    session_text    the session's distinct full-text stems (already stemmed
+                    by memory.stemmer, so the tokenizer doesn't stem again)
+    session_notes   one row per note, mirrored from the notes files
+
+Each session row also keeps its extracted data as a compressed pickle, so a
+StoredRecord can be rebuilt for just the sessions a tool returns, and
+extraction can resume from it when the transcript grows.
+"""
+
+import os
+import zlib
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Iterator
+
+from .record import SessionRecord, StoredRecord, Chapter
+from .snapshot import SNAPSHOT_VERSION
+from .timeline import timestamp_epoch
+
+
+# Bump whenever the tables change. The extracted data pickled into session
+# rows follows SNAPSHOT_VERSION, so a change to either rebuilds the database.
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE sessions (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL UNIQUE,
+    project TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    epoch REAL,
+    timestamp TEXT NOT NULL,
+    extracted BLOB NOT NULL
+);
+CREATE INDEX sessions_epoch ON sessions (epoch, session_id);
+CREATE INDEX sessions_project ON sessions (project);
+CREATE INDEX sessions_file_path ON sessions (file_path);
+
+CREATE TABLE chapters (
+    session_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    start_message INTEGER NOT NULL,
+    end_message INTEGER NOT NULL,
+    PRIMARY KEY (session_id, number)
+);
+
+CREATE VIRTUAL TABLE session_fields USING fts5(
+    todos, files, commands, tokenize = 'porter unicode61'
+);
+CREATE VIRTUAL TABLE session_substrings USING fts5(
+    todos, files, commands, tokenize = 'trigram'
+);
+CREATE VIRTUAL TABLE session_text USING fts5(text, tokenize = 'unicode61');
+CREATE VIRTUAL TABLE session_notes USING fts5(
+    session_id UNINDEXED, note, tokenize = 'porter unicode61'
+);
+"""
+
+_TABLES = ('sessions', 'chapters', 'session_fields', 'session_substrings', 'session_text',
+           'session_notes')
+
+# FTS5 column weights, mirroring BM25F_WEIGHTS in memory.index
+_FIELD_WEIGHTS = {'todos': 3.0, 'files': 2.0, 'commands': 1.0}
+_TEXT_WEIGHT = 1.0
+_NOTES_WEIGHT = 3.0
+
+
+def _phrases(words: Iterable[str]) -> str:
+    """FTS5 query matching any of the words, each quoted as a phrase"""
+    return ' OR '.join('"' + word.replace('"', '""') + '"'
+                       for word in words if any(c.isalnum() for c in word))
+
+
+def _filters(project: Optional[str], after: Optional[float],
+             before: Optional[float]) -> Tuple[str, List[Any]]:
+    """WHERE clause for the project and date filters (untimed sessions pass dates)"""
+    clauses = ['1']
+    params: List[Any] = []
+    if project:
+        clauses.append('instr(s.project, ?) > 0')
+        params.append(project)
+    if after is not None:
+        clauses.append('(s.epoch IS NULL OR s.epoch >= ?)')
+        params.append(after)
+    if before is not None:
+        clauses.append('(s.epoch IS NULL OR s.epoch <= ?)')
+        params.append(before)
+    return ' AND '.join(clauses), params
+
+
+class SqliteStore:
+    """The index as an SQLite database; one connection per thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Session id -> notes mirrored into session_notes by this process
+        self._notes_synced: Dict[str, int] = {}
+        self._create()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            # Autocommit; writes open their own transactions
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _create(self):
+        """Create the tables, rebuilding them if they are from another version"""
+        version = SNAPSHOT_VERSION << 8 | SCHEMA_VERSION
+        with self._transaction() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] == version:
+                return
+            for table in _TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+
+    def count(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def stamp(self, session_id: str) -> Optional[Tuple[str, float, int]]:
+        """(file path, mtime, size) the stored session was extracted from"""
+        return self._connection().execute(
+            'SELECT file_path, mtime, size FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+
+    def extracted(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The stored extract_conversation_data output, to resume extraction from"""
+        row = self._connection().execute(
+            'SELECT extracted FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return pickle.loads(zlib.decompress(row[0])) if row else None
+
+    def record(self, session_id: str) -> Optional[SessionRecord]:
+        row = self._connection().execute(
+            'SELECT session_id, file_path, mtime, size, extracted FROM sessions '
+            'WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return self._record(row)[1] if row else None
+
+    @staticmethod
+    def _record(row: tuple) -> Tuple[str, SessionRecord]:
+        session_id, file_path, mtime, size, extracted = row
+        data = pickle.loads(zlib.decompress(extracted))
+        return session_id, StoredRecord.from_extracted(data, file_path, mtime, size)
+
+    def put(self, session_id: str, extracted: Dict[str, Any], file_path: str,
+            mtime: float, size: int):
+        """Store a session's extracted data, replacing any earlier version"""
+        todos = extracted['final_todos']
+        all_todos = todos['completed'] + todos['in_progress'] + todos['pending']
+        blob = zlib.compress(pickle.dumps(extracted, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        values = (extracted['project'], file_path, mtime, size,
+                  timestamp_epoch(extracted['timestamp']), extracted['timestamp'], blob)
+
+        with self._transaction() as conn:
+            row = conn.execute('SELECT id FROM sessions WHERE session_id = ?',
+                               (session_id,)).fetchone()
+            if row is not None:
+                rowid = row[0]
+                conn.execute('UPDATE sessions SET project = ?, file_path = ?, mtime = ?, size = ?, '
+                             'epoch = ?, timestamp = ?, extracted = ? WHERE id = ?',
+                             values + (rowid,))
+                self._delete_rows(conn, rowid, session_id)
+            else:
+                rowid = conn.execute('INSERT INTO sessions (session_id, project, file_path, mtime, '
+                                     'size, epoch, timestamp, extracted) '
+                                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (session_id,) + values).lastrowid
+
+            fields = (rowid, '\n'.join(all_todos), '\n'.join(extracted['files_touched']),
+                      '\n'.join(extracted['commands_run']))
+            conn.execute('INSERT INTO session_fields (rowid, todos, files, commands) '
+                         'VALUES (?, ?, ?, ?)', fields)
+            conn.execute('INSERT INTO session_substrings (rowid, todos, files, commands) '
+                         'VALUES (?, ?, ?, ?)', fields)
+            conn.execute('INSERT INTO session_text (rowid, text) VALUES (?, ?)',
+                         (rowid, ' '.join(extracted['term_freqs'])))
+            conn.executemany('INSERT INTO chapters VALUES (?, ?, ?, ?, ?)', [
+                (session_id, number, chapter['title'], *chapter['message_range'])
+                for number, chapter in enumerate(extracted['chapters'], 1)
+            ])
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, rowid: int, session_id: str):
+        conn.execute('DELETE FROM session_fields WHERE rowid = ?', (rowid,))
+        conn.execute('DELETE FROM session_substrings WHERE rowid = ?', (rowid,))
+        conn.execute('DELETE FROM session_text WHERE rowid = ?', (rowid,))
+        conn.execute('DELETE FROM chapters WHERE session_id = ?', (session_id,))
+
+    def remove_file(self, file_path: str):
+        """Forget the session stored from a deleted file, notes included"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT id, session_id FROM sessions WHERE file_path = ?',
+                               (file_path,)).fetchone()
+            if row is None:
+                return
+            rowid, session_id = row
+            self._delete_rows(conn, rowid, session_id)
+            conn.execute('DELETE FROM session_notes WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE id = ?', (rowid,))
+
+    def file_paths(self) -> List[str]:
+        """Files of every stored session"""
+        return [row[0] for row in self._connection().execute('SELECT file_path FROM sessions')]
+
+    def recent(self, limit: int, offset: int, project: Optional[str], after: Optional[float],
+               before: Optional[float]) -> List[Tuple[str, SessionRecord]]:
+        """Sessions newest first, untimed ones last, from the offset-th on"""
+        where, params = _filters(project, after, before)
+        rows = self._connection().execute(
+            'SELECT session_id, file_path, mtime, size, extracted FROM sessions AS s '
+            f'WHERE {where} ORDER BY s.epoch DESC, s.session_id DESC LIMIT ? OFFSET ?',
+            params + [max(limit, 0), offset]
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def search(self, terms: List[str], stems: Iterable[str], fields: Iterable[str],
+               project: Optional[str], after: Optional[float],
+               before: Optional[float]) -> List[Tuple[float, str, str]]:
+        """
+        (score, timestamp, session id) for every session matching the query
+        in the given fields ('todos', 'files', 'commands', 'text', 'notes'),
+        scored by summed FTS5 BM25. As in the in-memory backend, a term also
+        matches todos, files and commands containing it anywhere (case
+        insensitive), adding the field's weight per term.
+        """
+        fields = set(fields)
+        hits: List[str] = []
+        params: List[Any] = []
+
+        columns = [column for column in _FIELD_WEIGHTS if column in fields]
+        query = _phrases(terms)
+        if columns and query:
+            weights = ', '.join(str(_FIELD_WEIGHTS[column] if column in columns else 0.0)
+                                for column in _FIELD_WEIGHTS)
+            hits.append(f'SELECT rowid, -bm25(session_fields, {weights}) FROM session_fields '
+                        'WHERE session_fields MATCH ?')
+            params.append('{%s} : (%s)' % (' '.join(columns), query))
+
+        # The trigram index narrows LIKE down for terms of three or more
+        # characters (but not with an ESCAPE clause, so wildcards in the term
+        # are left in and instr() checks the exact substring)
+        for term in dict.fromkeys(terms):
+            for column in columns:
+                hits.append(f'SELECT rowid, {_FIELD_WEIGHTS[column]} FROM session_substrings '
+                            f'WHERE {column} LIKE ? AND instr(lower({column}), ?) > 0')
+                params += [f'%{term}%', term]
+
+        stem_query = _phrases(sorted(stems))
+        if 'text' in fields and stem_query:
+            hits.append(f'SELECT rowid, -{_TEXT_WEIGHT} * bm25(session_text) FROM session_text '
+                        'WHERE session_text MATCH ?')
+            params.append(stem_query)
+
+        if 'notes' in fields and query:
+            hits.append('SELECT (SELECT id FROM sessions WHERE session_id = n.session_id), n.score '
+                        f'FROM (SELECT session_id, -{_NOTES_WEIGHT} * bm25(session_notes) AS score '
+                        'FROM session_notes WHERE session_notes MATCH ?) AS n')
+            params.append(query)
+
+        if not hits:
+            return []
+
+        where, filter_params = _filters(project, after, before)
+        return self._connection().execute(
+            'WITH hits (id, score) AS (' + ' UNION ALL '.join(hits) + ') '
+            'SELECT SUM(h.score), s.timestamp, s.session_id '
+            f'FROM hits AS h JOIN sessions AS s ON s.id = h.id WHERE {where} GROUP BY s.id',
+            params + filter_params
+        ).fetchall()
+
+    def chapters(self, session_id: str) -> List[Chapter]:
+        return [Chapter(*row) for row in self._connection().execute(
+            'SELECT title, start_message, end_message FROM chapters WHERE session_id = ? '
+            'ORDER BY number', (session_id,)
+        )]
+
+    def projects(self) -> List[str]:
+        return [row[0] for row in self._connection().execute(
+            'SELECT DISTINCT project FROM sessions ORDER BY project'
+        )]
+
+    def sync_notes(self, notes: Dict[str, List[str]]):
+        """Mirror notes added since the last sync (by any process) into session_notes"""
+        if all(self._notes_synced.get(session_id) == len(session_notes)
+               for session_id, session_notes in notes.items()):
+            return
+        with self._transaction() as conn:
+            stored = dict(conn.execute(
+                'SELECT session_id, COUNT(*) FROM session_notes GROUP BY session_id'
+            ))
+            # Notes are only ever appended, so the new ones are each list's tail
+            conn.executemany('INSERT INTO session_notes (session_id, note) VALUES (?, ?)', [
+                (session_id, note)
+                for session_id, session_notes in notes.items()
+                for note in session_notes[stored.get(session_id, 0):]
+            ])
+        self._notes_synced = {session_id: len(session_notes)
+                              for session_id, session_notes in notes.items()}
@@ -0,0 +1,116 @@
+"""
+Sessions ordered by start time.
+
+Keeps every cached session's timestamp pre-parsed to a UTC epoch in a
+sorted list, so a date range is two bisects and the most recent sessions
+come off the end without looking at the rest. Sessions without a usable
+timestamp pass every date filter and sort after all timed ones, as they
+always have in list_recent.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Iterator, Tuple
+
+
+# Up to this many sessions added since the last read are inserted one by
+# one; more than that (snapshot load, a cold index) and the list is re-sorted
+INSERT_MAX = 32
+
+
+def parse_timestamp(ts: str) -> Optional[datetime]:
+    """Parse ISO timestamp string to datetime, normalized to UTC"""
+    if not ts:
+        return None
+    try:
+        ts = ts.replace('Z', '+00:00')
+        dt = datetime.fromisoformat(ts)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt
+    except:
+        return None
+
+
+def timestamp_epoch(ts: Optional[str]) -> Optional[float]:
+    """ISO timestamp string as seconds since the epoch, or None if unparseable"""
+    dt = parse_timestamp(ts)
+    return dt.timestamp() if dt else None
+
+
+class Timeline:
+    """
+    entries: sorted (epoch, session_id) of timed sessions
+    epochs:  session_id -> epoch, or None if the session has no timestamp
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[float, str]] = []
+        self.epochs: Dict[str, Optional[float]] = {}
+        self._pending: Dict[str, float] = {}
+        self._untimed: Dict[str, None] = {}
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    def add(self, session_id: str, timestamp: Optional[str]):
+        """Place a session by its timestamp (replacing any earlier placement)"""
+        self.remove(session_id)
+        epoch = timestamp_epoch(timestamp)
+        self.epochs[session_id] = epoch
+        if epoch is None:
+            self._untimed[session_id] = None
+        else:
+            self._pending[session_id] = epoch
+
+    def remove(self, session_id: str):
+        if session_id not in self.epochs:
+            return
+        epoch = self.epochs.pop(session_id)
+        if epoch is None:
+            del self._untimed[session_id]
+        elif self._pending.pop(session_id, None) is None:
+            i = bisect_left(self.entries, (epoch, session_id))
+            del self.entries[i]
+
+    def epoch(self, session_id: str) -> Optional[float]:
+        return self.epochs.get(session_id)
+
+    def _settle(self):
+        """Merge sessions added since the last read into the sorted entries"""
+        if not self._pending:
+            return
+        if len(self._pending) <= INSERT_MAX:
+            for session_id, epoch in self._pending.items():
+                insort(self.entries, (epoch, session_id))
+        else:
+            self.entries.extend((epoch, session_id) for session_id, epoch in self._pending.items())
+            self.entries.sort()
+        self._pending.clear()
+
+    def newest(self, after: Optional[float] = None,
+               before: Optional[float] = None) -> Iterator[str]:
+        """
+        Session ids from newest to oldest within [after, before] (epochs;
+        None leaves that end open), followed by the untimed sessions.
+        Consume it under the cache lock.
+        """
+        self._settle()
+        entries = self.entries
+        lo = bisect_left(entries, (after,)) if after is not None else 0
+        hi = bisect_right(entries, (before, '\uffff')) if before is not None else len(entries)
+        for i in range(hi - 1, lo - 1, -1):
+            yield entries[i][1]
+        yield from list(self._untimed)
+
+    def in_range(self, session_id: str, after: Optional[float],
+                 before: Optional[float]) -> bool:
+        """Check one session against a date range, without parsing anything"""
+        epoch = self.epochs.get(session_id)
+        if epoch is None:
+            return True
+        if after is not None and epoch < after:
+            return False
+        if before is not None and epoch > before:
+            return False
+        return True
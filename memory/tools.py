@@ -3,27 +3,167 @@ MCP Tool definitions for the memory server.
 """
 
 import os
+import re
+import heapq
+import atexit
+import asyncio
 import glob as glob_module
-from typing import Optional
+from functools import wraps
+from itertools import islice
+from bisect import bisect_left, bisect_right
+from typing import Optional, List, Set, Tuple, Sequence, Iterator, Callable
 
 from mcp.server.fastmcp import FastMCP
 
-from . import CLAUDE_PROJECTS_PATH
-from .stemmer import stem_query
-from .extraction import parse_jsonl_file, extract_text_content
-from .cache import get_cache, ensure_cache_fresh, parse_timestamp
-from .notes import load_notes, get_notes_for_session, add_note_to_session
+from . import CLAUDE_PROJECTS_PATH, METRICS_PATH, metrics
+from .decoder import BACKEND
+from .stemmer import stem_query, stem_text, stem_word, stem_cache_stats
+from .extraction import (parse_jsonl_file, read_entries_at, read_messages_backward,
+                         extract_text_content, entry_text_parts)
+from .record import SessionRecord, get_vocabulary
+from .cache import (get_cache, get_search_index, get_timeline, get_generation, cache_lock,
+                    ensure_cache_fresh_async, get_indexing_progress, get_store,
+                    get_project_sessions, get_project_timelines, projects_matching,
+                    get_shard_counts)
+from .timeline import Timeline, timestamp_epoch
+from .paging import Ranking, encode_cursor, decode_cursor, get_ranking, keep_ranking
+from .notes import (load_notes, notes_lock, get_notes_for_session, get_note_freqs,
+                    get_all_notes, add_note_to_session, find_sessions_with_notes)
 
 
 mcp = FastMCP("memory")
 
 
+def _refresh_scope(kwargs: dict) -> Optional[List[str]]:
+    """
+    Projects a tool call reads, so only their shards are refreshed: those its
+    project filter matches, or the one holding its session. None for all.
+    """
+    project = kwargs.get('project')
+    if kwargs.get('cursor'):
+        state = decode_cursor(kwargs['cursor'])
+        project = state.args.get('project') if state is not None else None
+    if project:
+        return projects_matching(project)
+
+    session_id = kwargs.get('session_id')
+    if session_id:
+        store = get_store()
+        if store is not None:
+            stamp = store.stamp(session_id)
+            file_path = stamp[0] if stamp is not None else None
+        else:
+            data = get_cache().get(session_id)
+            file_path = data.file_path if data is not None else None
+        if file_path:
+            return [os.path.basename(os.path.dirname(file_path))]
+    return None
+
+
+def _in_thread(refresh: bool) -> Callable:
+    """
+    Run a blocking tool body in a worker thread so the event loop stays free
+    for concurrent calls, after the shared cache refresh if it reads the cache
+    (of just the projects it reads, when that is known up front).
+    """
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if refresh:
+                await ensure_cache_fresh_async(_refresh_scope(kwargs))
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _with_progress(response: dict) -> dict:
+    """Add indexingProgress (files done / total) while the startup warm-up runs"""
+    progress = get_indexing_progress()
+    if progress is not None:
+        response['indexingProgress'] = progress
+    return response
+
+
+def _in_scope(session_id: str, data: SessionRecord, project: Optional[str],
+              after_epoch: Optional[float], before_epoch: Optional[float]) -> bool:
+    """Apply the project and date filters shared by list_recent and search_memory"""
+    if project and project not in data.project:
+        return False
+    return get_timeline().in_range(session_id, after_epoch, before_epoch)
+
+
+def _get_session(session_id: str) -> Optional[SessionRecord]:
+    """A session's record, from the SQLite store or the in-memory cache"""
+    store = get_store()
+    if store is not None:
+        return store.record(session_id)
+    return get_cache().get(session_id)
+
+
+def _recent_entry(session_id: str, data: SessionRecord) -> dict:
+    """One list_recent result"""
+    completed = list(data.completed)
+    notes = get_notes_for_session(session_id)
+
+    if completed:
+        summary = ', '.join(completed[:3])
+    else:
+        arc = data.user_message_arc
+        user_turn_count = data.user_message_count
+
+        if len(arc) == 1:
+            summary = f"[1 turn] {arc[0]}"
+        elif len(arc) == 2:
+            summary = f"[{user_turn_count} turns] {arc[0]} ... {arc[1]}"
+        else:
+            summary = data.first_message
+
+    return {
+        'sessionId': session_id,
+        'project': data.project,
+        'timestamp': data.timestamp,
+        'summary': summary,
+        'completed': completed,
+        'inProgress': list(data.in_progress),
+        'pending': list(data.pending),
+        'messageCount': data.message_count,
+        'userMessageCount': data.user_message_count,
+        'hasChapters': len(data.chapters) > 0,
+        'filesTouched': list(data.files_touched[:5]),
+        'hasNotes': len(notes) > 0
+    }
+
+
+def _merge_newest(timelines: List[Timeline], after_epoch: Optional[float],
+                  before_epoch: Optional[float]) -> Iterator[str]:
+    """Session ids of several shards newest first, untimed ones last"""
+    if len(timelines) == 1:
+        return timelines[0].newest(after_epoch, before_epoch)
+
+    def newest_first(timeline: Timeline) -> Iterator[Tuple[bool, float, str]]:
+        for session_id in timeline.newest(after_epoch, before_epoch):
+            epoch = timeline.epoch(session_id)
+            # Untimed sessions all tie, so they keep their shard's order
+            yield ((True, epoch, session_id) if epoch is not None else (False, 0.0, ''),
+                   session_id)
+
+    merged = heapq.merge(*map(newest_first, timelines), key=lambda item: item[0], reverse=True)
+    return (session_id for _, session_id in merged)
+
+
+# list_recent arguments carried in its cursors
+_RECENT_ARGS = ('project', 'after', 'before')
+
+
 @mcp.tool()
-async def list_recent(
+@metrics.timed('tool.list_recent')
+@_in_thread(refresh=True)
+def list_recent(
     limit: int = 20,
     project: Optional[str] = None,
     after: Optional[str] = None,
-    before: Optional[str] = None
+    before: Optional[str] = None,
+    cursor: Optional[str] = None
 ) -> dict:
     """
     Browse recent sessions. Use when starting fresh or looking for recent work.
@@ -33,74 +173,367 @@ async def list_recent(
         project: Filter by project name
         after: Only sessions after this date (ISO format, e.g., "2025-01-15")
         before: Only sessions before this date
+        cursor: nextCursor from a previous call, to get the next (older) page
+            of that listing (its filters are used; pass limit as usual)
 
     Returns:
-        Sessions sorted by recency with summaries from todos or user messages
+        Sessions sorted by recency with summaries from todos or user messages,
+        and nextCursor when more remain
     """
-    ensure_cache_fresh()
     load_notes()
 
-    after_dt = parse_timestamp(after) if after else None
-    before_dt = parse_timestamp(before) if before else None
+    offset = 0
+    if cursor:
+        state = decode_cursor(cursor)
+        if state is None:
+            return {'error': 'Invalid cursor. List again without one.', 'success': False}
+        offset = state.offset
+        project, after, before = (state.args.get(name) for name in _RECENT_ARGS)
+    args = dict(zip(_RECENT_ARGS, (project, after, before)))
+    limit = max(limit, 0)
+
+    after_epoch = timestamp_epoch(after) if after else None
+    before_epoch = timestamp_epoch(before) if before else None
+
+    # One past the page, to tell whether there is another
+    store = get_store()
+    if store is not None:
+        page = store.recent(limit + 1, offset, project, after_epoch, before_epoch)
+        generation = get_generation()
+    else:
+        with cache_lock():
+            cache = get_cache()
+            generation = get_generation()
+
+            # Newest first straight off the timeline (of just the filtered
+            # projects' shards): only the sessions returned, or skipped by the
+            # offset, are looked at
+            if project:
+                newest = _merge_newest(get_project_timelines(projects_matching(project)),
+                                       after_epoch, before_epoch)
+            else:
+                newest = get_timeline().newest(after_epoch, before_epoch)
+            page = [(session_id, cache[session_id])
+                    for session_id in islice(newest, offset, offset + limit + 1)]
+
+    return _with_progress({
+        'sessions': [_recent_entry(session_id, data) for session_id, data in page[:limit]],
+        'nextCursor': (encode_cursor(None, offset + limit, args)
+                       if limit and len(page) > limit else None),
+        'indexGeneration': generation
+    })
+
+
+def _search_candidates(query_terms: List[str], query_stems: Set[str], search_mode: str) -> Set[str]:
+    """Sessions that can score above zero in this mode, from the inverted index"""
+    index = get_search_index()
+    candidates = find_sessions_with_notes(query_terms)
+
+    if search_mode in ['smart', 'todos']:
+        candidates |= index.match_substrings('todos', query_terms)
+        candidates |= index.match_stems('todos', query_stems)
+
+    if search_mode in ['smart', 'files']:
+        candidates |= index.match_substrings('files', query_terms)
+
+    if search_mode in ['smart', 'full']:
+        candidates |= index.match_substrings('commands', query_terms)
+        candidates |= index.match_stems('text', query_stems)
+        candidates |= index.match_substrings('messages', query_terms)
+
+    return candidates
+
+
+# Message locations returned per full-text search result, and snippet width
+MAX_HITS = 3
+SNIPPET_CHARS = 160
+
+
+def _snippet(text: str, query_stems: Set[str]) -> str:
+    """A window of text around the first query match, with matched words in bold"""
+    text = ' '.join(text.split())
+    matches = [m for m in re.finditer(r'\b[a-zA-Z]+\b', text)
+               if len(m.group()) > 2 and stem_word(m.group().lower()) in query_stems]
+    if not matches:
+        return text[:SNIPPET_CHARS]
+
+    first = matches[0]
+    start = max(0, first.start() - SNIPPET_CHARS // 4)
+    end = min(len(text), start + SNIPPET_CHARS)
+    # Don't cut words at either end
+    if start:
+        start = text.find(' ', start, first.start()) + 1 or start
+    if end < len(text):
+        end = max(text.rfind(' ', first.end(), end), first.end())
+    parts = ['...' if start else '']
+    pos = start
+    for m in matches:
+        if m.end() > end:
+            break
+        parts += [text[pos:m.start()], f"**{m.group()}**"]
+        pos = m.end()
+    parts.append(text[pos:end])
+    if end < len(text):
+        parts.append('...')
+    return ''.join(parts)
+
+
+def _message_hits(data: SessionRecord, query_stems: Set[str]) -> List[dict]:
+    """
+    The messages of a session matching the most query stems, located by
+    position (for read_messages start/end), user turn and chapter. Only
+    those few lines are read back, for their snippets.
+    """
+    hits = data.message_hits(query_stems, MAX_HITS)
+    if not hits:
+        return []
+
+    offsets = data.message_offsets
+    entries = read_entries_at(data.file_path, [offsets[position] for position, _ in hits],
+                              skim=True)
+    # Chapters cover consecutive message ranges from the start of the session
+    chapter_ends = [chapter.end for chapter in data.chapters]
+
+    located = []
+    for (position, matched), entry in zip(hits, entries):
+        chapter = bisect_right(chapter_ends, position)
+        located.append({
+            'message': position,
+            'turn': data.message_turns[position],
+            'chapter': chapter + 1 if chapter < len(chapter_ends) else None,
+            'matchedStems': matched,
+            'snippet': _snippet(' '.join(entry_text_parts(entry)), query_stems) if entry else ''
+        })
+    return located
+
+
+def _search_summary(data: SessionRecord) -> str:
+    """Short session summary for search results"""
+    completed = data.completed
+
+    if completed:
+        return ', '.join(completed[:3])
+
+    arc = data.user_message_arc
+    user_turn_count = data.user_message_count
+    if len(arc) == 2:
+        return f"[{user_turn_count} turns] {arc[0][:80]} ... {arc[1][:80]}"
+    elif len(arc) == 1:
+        return f"[{user_turn_count} turns] {arc[0][:100]}"
+    return data.first_message[:100]
+
+
+def _classic_matches(
+    session_id: str,
+    data: SessionRecord,
+    query_terms: List[str],
+    query_stems: Set[str],
+    search_mode: str
+) -> Tuple[int, List[str], List[str], List[str], List[str]]:
+    """
+    Score one session against a query with the classic weighted match counts.
+    Returns (score, match sources, matched todos, files, notes); 0 if it doesn't match.
+    """
+    score = 0
+    matched_todos = []
+    matched_files = []
+    matched_notes = []
+    match_source = []
+
+    if search_mode in ['smart', 'todos']:
+        for todo in data.all_todos:
+            todo_lower = todo.lower()
+            matches = sum(1 for term in query_terms if term in todo_lower)
+            if matches > 0:
+                score += matches * 3
+                matched_todos.append(todo)
+                if 'todos' not in match_source:
+                    match_source.append('todos')
+
+        stem_matches = data.count_stems('todos', query_stems)
+        if stem_matches > 0 and not matched_todos:
+            score += stem_matches * 2
+            if 'todos_stemmed' not in match_source:
+                match_source.append('todos_stemmed')
+
+    notes = get_notes_for_session(session_id)
+    for note in notes:
+        note_lower = note.lower()
+        matches = sum(1 for term in query_terms if term in note_lower)
+        if matches > 0:
+            score += matches * 3
+            matched_notes.append(note)
+            if 'notes' not in match_source:
+                match_source.append('notes')
+
+    if search_mode in ['smart', 'files']:
+        for f in data.files_touched:
+            f_lower = f.lower()
+            if any(term in f_lower for term in query_terms):
+                score += 2
+                matched_files.append(f)
+                if 'files' not in match_source:
+                    match_source.append('files')
+
+    if search_mode in ['smart', 'full']:
+        for cmd in data.commands_run:
+            cmd_lower = cmd.lower()
+            if any(term in cmd_lower for term in query_terms):
+                score += 1
+                if 'commands' not in match_source:
+                    match_source.append('commands')
+
+    if search_mode in ['smart', 'full'] and score == 0:
+        stem_matches = data.count_stems('text', query_stems)
+        if stem_matches > 0:
+            score += stem_matches
+            match_source.append('full_text')
+
+        for msg in data.user_message_arc:
+            msg_lower = msg.lower()
+            if any(term in msg_lower for term in query_terms):
+                score += 1
+                if 'messages' not in match_source:
+                    match_source.append('messages')
+
+    return score, match_source, matched_todos, matched_files, matched_notes
+
+
+def _classic_result(session_id: str, data: SessionRecord, query_terms: List[str],
+                    query_stems: Set[str], search_mode: str) -> Optional[dict]:
+    """Build a search result for a session ranked by the classic scoring"""
+    score, match_source, matched_todos, matched_files, matched_notes = _classic_matches(
+        session_id, data, query_terms, query_stems, search_mode)
+    if score == 0:
+        return None
+
+    return {
+        'sessionId': session_id,
+        'score': score,
+        'matchSource': match_source,
+        'matchedTodos': matched_todos[:5],
+        'matchedFiles': matched_files[:5],
+        'matchedNotes': matched_notes[:3],
+        'messageHits': (_message_hits(data, query_stems)
+                        if search_mode in ['smart', 'full'] else []),
+        'summary': _search_summary(data),
+        'project': data.project,
+        'timestamp': data.timestamp,
+        'userMessageCount': data.user_message_count,
+        'hasChapters': len(data.chapters) > 0
+    }
+
+
+# Fields ranked by BM25F in each search mode (notes are always searched)
+_BM25_FIELDS = {
+    'smart': ['todos', 'notes', 'files', 'text'],
+    'todos': ['todos', 'notes'],
+    'files': ['files', 'notes'],
+    'full': ['notes', 'text'],
+}
+
+
+def _bm25_fields(search_mode: str) -> List[str]:
+    fields = _BM25_FIELDS.get(search_mode, _BM25_FIELDS['smart'])
+    if get_store() is not None and search_mode in ['smart', 'full']:
+        # FTS5 indexes commands too, where BM25F leaves them to the classic scoring
+        fields = fields + ['commands']
+    return fields
+
+
+def _bm25_result(session_id: str, data: SessionRecord, score: float, query_stems: Set[str],
+                 fields: List[str], query_terms: Sequence[str] = ()) -> dict:
+    """
+    Build a search result for a session ranked by BM25F (or FTS5, which also
+    matches todos and files containing any of query_terms)
+    """
+    def matches(text: str) -> bool:
+        return bool(query_stems & stem_text(text)) or any(term in text.lower()
+                                                           for term in query_terms)
+
+    matched_todos = [t for t in data.all_todos if matches(t)] if 'todos' in fields else []
+    matched_files = [f for f in data.files_touched if matches(f)] if 'files' in fields else []
+    matched_notes = ([n for n in get_notes_for_session(session_id) if query_stems & stem_text(n)]
+                     if 'notes' in fields else [])
+
+    match_source = []
+    for field, matched in [('todos', matched_todos), ('notes', matched_notes),
+                           ('files', matched_files)]:
+        if matched:
+            match_source.append(field)
+    message_hits = _message_hits(data, query_stems) if 'text' in fields else []
+    if message_hits:
+        match_source.append('full_text')
+
+    return {
+        'sessionId': session_id,
+        # Four significant digits for small scores, which FTS5 gives common terms
+        'score': round(score, 4) if abs(score) >= 1 else float(f'{score:.4g}'),
+        'matchSource': match_source,
+        'matchedTodos': matched_todos[:5],
+        'matchedFiles': matched_files[:5],
+        'matchedNotes': matched_notes[:3],
+        'messageHits': message_hits,
+        'summary': _search_summary(data),
+        'project': data.project,
+        'timestamp': data.timestamp,
+        'userMessageCount': data.user_message_count,
+        'hasChapters': len(data.chapters) > 0
+    }
+
 
-    conversations = []
+def _rank_bm25(query_stems: Set[str], project: Optional[str], after_epoch, before_epoch,
+               search_mode: str) -> Ranking:
+    """(score, timestamp, session id) for every session BM25F scores above zero"""
     cache = get_cache()
+    scores = get_search_index().bm25(query_stems, _bm25_fields(search_mode), get_note_freqs())
 
-    for session_id, data in cache.items():
-        if project and project not in data.get('project', ''):
-            continue
+    ranked = []
+    for session_id, score in scores.items():
+        data = cache.get(session_id)
+        if data is not None and _in_scope(session_id, data, project, after_epoch, before_epoch):
+            ranked.append((score, data.timestamp, session_id))
+    return ranked
 
-        conv_dt = parse_timestamp(data.get('timestamp', ''))
-        if after_dt and conv_dt and conv_dt < after_dt:
-            continue
-        if before_dt and conv_dt and conv_dt > before_dt:
-            continue
 
-        completed = data['final_todos'].get('completed', [])
-        pending = data['final_todos'].get('pending', [])
-        in_progress = data['final_todos'].get('in_progress', [])
-        notes = get_notes_for_session(session_id)
+def _rank_classic(query_terms: List[str], query_stems: Set[str], project: Optional[str],
+                  after_epoch, before_epoch, search_mode: str) -> Ranking:
+    """(score, timestamp, session id) for every session the classic scoring matches"""
+    cache = get_cache()
+    ranked = []
 
-        if completed:
-            summary = ', '.join(completed[:3])
-        else:
-            arc = data.get('user_message_arc', [])
-            user_turn_count = data.get('user_message_count', 0)
+    candidates = _search_candidates(query_terms, query_stems, search_mode)
+    if project:
+        candidates &= get_project_sessions(projects_matching(project))
 
-            if len(arc) == 1:
-                summary = f"[1 turn] {arc[0]}"
-            elif len(arc) == 2:
-                summary = f"[{user_turn_count} turns] {arc[0]} ... {arc[1]}"
-            else:
-                summary = data.get('first_message', 'No todos')
+    for session_id in candidates:
+        data = cache.get(session_id)
+        if data is None or not _in_scope(session_id, data, project, after_epoch, before_epoch):
+            continue
 
-        conversations.append({
-            'sessionId': session_id,
-            'project': data.get('project', ''),
-            'timestamp': data.get('timestamp', ''),
-            'summary': summary,
-            'completed': completed,
-            'inProgress': in_progress,
-            'pending': pending,
-            'messageCount': data.get('message_count', 0),
-            'userMessageCount': data.get('user_message_count', 0),
-            'hasChapters': len(data.get('chapters', [])) > 0,
-            'filesTouched': data.get('files_touched', [])[:5],
-            'hasNotes': len(notes) > 0
-        })
+        score = _classic_matches(session_id, data, query_terms, query_stems, search_mode)[0]
+        if score > 0:
+            ranked.append((score, data.timestamp or '', session_id))
 
-    conversations.sort(key=lambda x: x['timestamp'] or '', reverse=True)
-    return {'sessions': conversations[:limit]}
+    return ranked
+
+
+# search_memory arguments carried in its cursors
+_SEARCH_ARGS = ('query', 'project', 'after', 'before', 'search_mode', 'ranking')
 
 
 @mcp.tool()
-async def search_memory(
+@metrics.timed('tool.search_memory')
+@_in_thread(refresh=True)
+def search_memory(
     query: str,
     limit: int = 20,
     project: Optional[str] = None,
     after: Optional[str] = None,
     before: Optional[str] = None,
-    search_mode: str = "smart"
+    search_mode: str = "smart",
+    ranking: str = "classic",
+    cursor: Optional[str] = None
 ) -> dict:
     """
     Find past sessions by keyword. Searches todos, notes, files touched, and full text.
@@ -114,143 +547,98 @@ async def search_memory(
         after: Only sessions after this date (ISO format)
         before: Only sessions before this date
         search_mode: "smart" (default), "todos", "full", or "files"
+        ranking: "classic" (default) weighted match counts, or "bm25" relevance
+            ranking on stemmed terms across todos, notes, files, and full text
+        cursor: nextCursor from a previous call, to get the next page of
+            that search (its query and filters are used; pass limit as usual)
 
     Returns:
-        Ranked sessions with match source and summaries
+        Ranked sessions with match source and summaries. In "smart" and "full"
+        modes, messageHits points at the messages matching the most query terms
+        (position, user turn, chapter, highlighted snippet), ready for read_messages.
+        nextCursor is set when more results remain.
     """
-    ensure_cache_fresh()
     load_notes()
 
-    after_dt = parse_timestamp(after) if after else None
-    before_dt = parse_timestamp(before) if before else None
+    token, offset = None, 0
+    if cursor:
+        state = decode_cursor(cursor)
+        if state is None:
+            return {'error': 'Invalid cursor. Run the search again without one.', 'success': False}
+        token, offset = state.token, state.offset
+        query, project, after, before, search_mode, ranking = (
+            state.args.get(name) for name in _SEARCH_ARGS)
+        query = query or ''
+        search_mode = search_mode or 'smart'
+    args = dict(zip(_SEARCH_ARGS, (query, project, after, before, search_mode, ranking)))
+
+    after_epoch = timestamp_epoch(after) if after else None
+    before_epoch = timestamp_epoch(before) if before else None
 
     query_stems = stem_query(query)
     query_terms = query.lower().split()
-    results = []
-    cache = get_cache()
-
-    for session_id, data in cache.items():
-        if project and project not in data.get('project', ''):
-            continue
-
-        conv_dt = parse_timestamp(data.get('timestamp', ''))
-        if after_dt and conv_dt and conv_dt < after_dt:
-            continue
-        if before_dt and conv_dt and conv_dt > before_dt:
-            continue
-
-        score = 0
-        matched_todos = []
-        matched_files = []
-        matched_notes = []
-        match_source = []
-
-        all_todos = (data['final_todos'].get('completed', []) +
-                    data['final_todos'].get('in_progress', []) +
-                    data['final_todos'].get('pending', []))
-
-        if search_mode in ['smart', 'todos']:
-            for todo in all_todos:
-                todo_lower = todo.lower()
-                matches = sum(1 for term in query_terms if term in todo_lower)
-                if matches > 0:
-                    score += matches * 3
-                    matched_todos.append(todo)
-                    if 'todos' not in match_source:
-                        match_source.append('todos')
-
-            stemmed_todos = data.get('stemmed_todos', set())
-            stem_matches = len(query_stems & stemmed_todos)
-            if stem_matches > 0 and not matched_todos:
-                score += stem_matches * 2
-                if 'todos_stemmed' not in match_source:
-                    match_source.append('todos_stemmed')
-
-        notes = get_notes_for_session(session_id)
-        for note in notes:
-            note_lower = note.lower()
-            matches = sum(1 for term in query_terms if term in note_lower)
-            if matches > 0:
-                score += matches * 3
-                matched_notes.append(note)
-                if 'notes' not in match_source:
-                    match_source.append('notes')
-
-        if search_mode in ['smart', 'files']:
-            files = data.get('files_touched', [])
-            for f in files:
-                f_lower = f.lower()
-                if any(term in f_lower for term in query_terms):
-                    score += 2
-                    matched_files.append(f)
-                    if 'files' not in match_source:
-                        match_source.append('files')
-
-        if search_mode in ['smart', 'full']:
-            commands = data.get('commands_run', [])
-            for cmd in commands:
-                cmd_lower = cmd.lower()
-                if any(term in cmd_lower for term in query_terms):
-                    score += 1
-                    if 'commands' not in match_source:
-                        match_source.append('commands')
-
-        if search_mode in ['smart', 'full'] and score == 0:
-            stemmed_terms = data.get('stemmed_terms', set())
-            stem_matches = len(query_stems & stemmed_terms)
-            if stem_matches > 0:
-                score += stem_matches
-                match_source.append('full_text')
-
-            arc = data.get('user_message_arc', [])
-            for msg in arc:
-                msg_lower = msg.lower()
-                if any(term in msg_lower for term in query_terms):
-                    score += 1
-                    if 'messages' not in match_source:
-                        match_source.append('messages')
 
-        if score > 0:
-            completed = data['final_todos'].get('completed', [])
-
-            if completed:
-                summary = ', '.join(completed[:3])
-            else:
-                arc = data.get('user_message_arc', [])
-                user_turn_count = data.get('user_message_count', 0)
-                if len(arc) == 2:
-                    summary = f"[{user_turn_count} turns] {arc[0][:80]} ... {arc[1][:80]}"
-                elif len(arc) == 1:
-                    summary = f"[{user_turn_count} turns] {arc[0][:100]}"
+    store = get_store()
+    if store is not None:
+        ranking = 'fts5'
+    elif ranking != 'bm25':
+        ranking = 'classic'
+    limit = max(limit, 0)
+
+    with cache_lock(), notes_lock():
+        ranked = get_ranking(token)
+        if ranked is None:
+            with metrics.timer('search.score'):
+                if store is not None:
+                    store.sync_notes(get_all_notes())
+                    ranked = store.search(query_terms, query_stems, _bm25_fields(search_mode),
+                                          project, after_epoch, before_epoch)
+                elif ranking == 'bm25':
+                    ranked = _rank_bm25(query_stems, project, after_epoch, before_epoch,
+                                        search_mode)
                 else:
-                    summary = data.get('first_message', '')[:100]
-
-            results.append({
-                'sessionId': session_id,
-                'score': score,
-                'matchSource': match_source,
-                'matchedTodos': matched_todos[:5],
-                'matchedFiles': matched_files[:5],
-                'matchedNotes': matched_notes[:3],
-                'summary': summary,
-                'project': data.get('project', ''),
-                'timestamp': data.get('timestamp', ''),
-                'userMessageCount': data.get('user_message_count', 0),
-                'hasChapters': len(data.get('chapters', [])) > 0
-            })
-
-    results.sort(key=lambda x: (x['score'], x['timestamp'] or ''), reverse=True)
-
-    return {
-        'results': results[:limit],
-        'totalMatches': len(results),
+                    ranked = _rank_classic(query_terms, query_stems, project, after_epoch,
+                                           before_epoch, search_mode)
+            token = keep_ranking(token, ranked)
+
+        # Only the returned page is turned into results
+        page = heapq.nlargest(offset + limit, ranked)[offset:]
+        records = [(score, session_id, _get_session(session_id))
+                   for score, _, session_id in page]
+        generation = get_generation()
+
+    # Records are replaced rather than changed, so results (whose message hits
+    # read the transcripts) are built without holding up refreshes
+    results = []
+    for score, session_id, data in records:
+        if data is None:
+            continue
+        if ranking == 'classic':
+            result = _classic_result(session_id, data, query_terms, query_stems, search_mode)
+        else:
+            result = _bm25_result(session_id, data, score, query_stems,
+                                  _bm25_fields(search_mode),
+                                  query_terms if store is not None else ())
+        if result is not None:
+            results.append(result)
+
+    next_offset = offset + len(page)
+    return _with_progress({
+        'results': results,
+        'totalMatches': len(ranked),
         'searchMode': search_mode,
-        'queryStems': list(query_stems)
-    }
+        'ranking': ranking,
+        'queryStems': list(query_stems),
+        'nextCursor': (encode_cursor(token, next_offset, args)
+                       if len(page) and next_offset < len(ranked) else None),
+        'indexGeneration': generation
+    })
 
 
 @mcp.tool()
-async def add_note(session_id: str, note: str) -> dict:
+@metrics.timed('tool.add_note')
+@_in_thread(refresh=False)
+def add_note(session_id: str, note: str) -> dict:
     """
     Leave a breadcrumb on a session for future searches.
 
@@ -275,7 +663,9 @@ async def add_note(session_id: str, note: str) -> dict:
 
 
 @mcp.tool()
-async def list_chapters(session_id: str) -> dict:
+@metrics.timed('tool.list_chapters')
+@_in_thread(refresh=True)
+def list_chapters(session_id: str) -> dict:
     """
     See the structure of a session: chapters (from completed todos), pending work, files touched, and notes.
 
@@ -285,38 +675,39 @@ async def list_chapters(session_id: str) -> dict:
     Returns:
         Chapters with message ranges, pending work, activity signals, and any notes
     """
-    ensure_cache_fresh()
     load_notes()
 
-    cache = get_cache()
+    data = _get_session(session_id)
 
-    if session_id not in cache:
-        return {
+    if data is None:
+        return _with_progress({
             'error': f'Session "{session_id}" not found. Use search_memory() or list_recent() to find valid session IDs.',
             'success': False
-        }
+        })
 
-    data = cache[session_id]
     notes = get_notes_for_session(session_id)
+    store = get_store()
+    chapters = store.chapters(session_id) if store is not None else data.chapters
 
-    return {
+    return _with_progress({
         'success': True,
         'sessionId': session_id,
-        'chapters': data.get('chapters', []),
+        'chapters': [chapter.as_dict() for chapter in chapters],
         'pendingWork': [
             {'title': todo, 'status': 'pending'}
-            for todo in data['final_todos'].get('pending', [])
+            for todo in data.pending
         ] + [
             {'title': todo, 'status': 'in_progress'}
-            for todo in data['final_todos'].get('in_progress', [])
+            for todo in data.in_progress
         ],
         'notes': notes,
-        'filesTouched': data.get('files_touched', []),
-        'commandsRun': data.get('commands_run', [])[:10],
-        'urlsFetched': data.get('urls_fetched', [])[:10],
-        'totalMessages': data.get('message_count', 0),
-        'userTurns': data.get('user_message_count', 0)
-    }
+        'filesTouched': list(data.files_touched),
+        'commandsRun': list(data.commands_run[:10]),
+        'urlsFetched': list(data.urls_fetched[:10]),
+        'totalMessages': data.message_count,
+        'userTurns': data.user_message_count,
+        'indexGeneration': get_generation()
+    })
 
 
 def _get_tool_detail(tool_name: str, tool_input: dict) -> str:
@@ -343,48 +734,272 @@ def _get_tool_detail(tool_name: str, tool_input: dict) -> str:
     return ''
 
 
+def _format_message(entry: dict, index: int, user_turn: int) -> dict:
+    """Render a user or assistant entry for read_messages"""
+    if entry.get('type') == 'user':
+        return {
+            'role': 'user',
+            'content': extract_text_content(entry['message'].get('content', '')),
+            'timestamp': entry.get('timestamp', ''),
+            'index': index,
+            'userTurn': user_turn
+        }
+
+    parts = []
+    for item in entry['message'].get('content', []):
+        if isinstance(item, dict):
+            if item.get('type') == 'text':
+                parts.append(item.get('text', ''))
+            elif item.get('type') == 'tool_use':
+                tool_name = item.get('name', 'unknown')
+                tool_input = item.get('input', {})
+                tool_detail = _get_tool_detail(tool_name, tool_input)
+                if tool_detail:
+                    parts.append(f"[{tool_name}: {tool_detail}]")
+                else:
+                    parts.append(f"[{tool_name}]")
+
+    return {
+        'role': 'assistant',
+        'content': '\n'.join(parts),
+        'timestamp': entry.get('timestamp', ''),
+        'index': index,
+        'userTurn': user_turn
+    }
+
+
+def _read_all_messages(file_path: str) -> List[dict]:
+    """Parse every message of a session from the start of the file"""
+    messages = []
+    message_index = 0
+    user_turn_count = 0
+
+    for entry in parse_jsonl_file(file_path):
+        if entry.get('type') in ['user', 'assistant']:
+            message_index += 1
+            if entry.get('message'):
+                if entry['type'] == 'user':
+                    user_turn_count += 1
+                messages.append(_format_message(entry, message_index, user_turn_count))
+
+    return messages
+
+
+def _load_messages(data: SessionRecord, positions: range, include_assistant: bool) -> List[dict]:
+    """
+    Load messages by position using the session's offset index, decoding
+    only the requested lines.
+    """
+    offsets = data.message_offsets
+    indices = data.message_indices
+    turns = data.message_turns
+    positions = range(max(0, positions.start), min(len(offsets), positions.stop))
+
+    if not include_assistant:
+        # A message is a user turn exactly where the turn counter moves
+        positions = [i for i in positions if turns[i] != (turns[i - 1] if i else 0)]
+
+    entries = read_entries_at(data.file_path, [offsets[i] for i in positions], skim=True)
+
+    messages = []
+    for i, entry in zip(positions, entries):
+        if not entry or entry.get('type') not in ['user', 'assistant'] or not entry.get('message'):
+            # File no longer matches the index (rewritten in place): parse it fully
+            fallback = _read_all_messages(data.file_path)
+            return [fallback[i] for i in positions if i < len(fallback)]
+        messages.append(_format_message(entry, indices[i], turns[i]))
+
+    return messages
+
+
+def _find_session_file(session_id: str) -> Optional[str]:
+    """A session's transcript, looked up on disk (for sessions not indexed yet)"""
+    matches = glob_module.glob(os.path.join(CLAUDE_PROJECTS_PATH, '*', f'{session_id}.jsonl'))
+    return matches[0] if matches else None
+
+
+def _scan_tail(file_path: str) -> Iterator[Tuple[int, int, dict]]:
+    """
+    (position, user turn, entry) for messages from the end of the file back,
+    both counted from the end (-1 is the last message, and the latest turn)
+    """
+    users = 0
+    for k, (_, entry) in enumerate(read_messages_backward(file_path)):
+        turn = -(users + 1)
+        if entry['type'] == 'user':
+            users += 1
+        yield -(k + 1), turn, entry
+
+
+def _read_tail(session_id: str, data: Optional[SessionRecord], file_path: str, last: int,
+               before: Optional[int], include_assistant: bool) -> dict:
+    """
+    read_messages(last=N): the last N messages before `before`. Uses the
+    offset index while it covers the whole file; otherwise (session not
+    indexed yet, or grown since) scans back from the end of the file, with
+    positions counted from the end.
+    """
+    if last < 1:
+        return {'error': 'last must be at least 1.', 'success': False}
+
+    if data is not None and os.path.getsize(file_path) == data.size:
+        turns = data.message_turns
+        total_messages = len(turns)
+        end = total_messages
+        if before is not None:
+            end = max(0, min(end, before if before >= 0 else total_messages + before))
+
+        start = end
+        taken = 0
+        while start > 0 and taken < last:
+            start -= 1
+            if include_assistant or turns[start] != (turns[start - 1] if start else 0):
+                taken += 1
+
+        return {
+            'success': True,
+            'sessionId': session_id,
+            'navigationMode': 'tail',
+            'messageRange': (start, end),
+            'messages': _load_messages(data, range(start, end), include_assistant),
+            'totalMessages': total_messages,
+            'totalUserTurns': turns[-1] if turns else 0,
+            'canPageBackward': start > 0,
+            'pageBackward': {'last': last, 'before': start} if start > 0 else None
+        }
+
+    if before is not None and before >= 0:
+        return {
+            'error': 'This session is still being indexed: page backward with the negative '
+                     'before cursor from the previous call.',
+            'success': False
+        }
+
+    selected = []
+    more = False
+    for position, user_turn, entry in _scan_tail(file_path):
+        if before is not None and position >= before:
+            continue
+        if not include_assistant and entry['type'] != 'user':
+            continue
+        if len(selected) == last:
+            more = True
+            break
+        selected.append(_format_message(entry, position, user_turn))
+    selected.reverse()
+
+    start = selected[0]['index'] if selected else (before or 0)
+    end = selected[-1]['index'] + 1 if selected else (before or 0)
+    return {
+        'success': True,
+        'sessionId': session_id,
+        'navigationMode': 'tail',
+        'messageRange': (start, end),
+        'messages': selected,
+        'canPageBackward': more,
+        'pageBackward': {'last': last, 'before': start} if more else None
+    }
+
+
+def _read_turn_from_end(session_id: str, file_path: str, turn: int,
+                        include_assistant: bool) -> dict:
+    """read_messages(turn=-N) without an up-to-date index: scan back to that turn"""
+    context_turns = 2
+    target_start_turn = turn - context_turns
+    target_end_turn = min(-1, turn + context_turns)
+
+    selected = []
+    earliest_turn = 0
+    earlier = False
+    for position, user_turn, entry in _scan_tail(file_path):
+        if user_turn < target_start_turn:
+            earlier = True
+            break
+        earliest_turn = user_turn
+        if user_turn <= target_end_turn and (include_assistant or entry['type'] == 'user'):
+            selected.append(_format_message(entry, position, user_turn))
+    selected.reverse()
+
+    if earliest_turn > turn:
+        return {
+            'error': f'Turn {turn} out of range. This session has {-earliest_turn} user turns.',
+            'success': False
+        }
+
+    return {
+        'success': True,
+        'sessionId': session_id,
+        'navigationMode': 'turn',
+        'requestedTurn': turn,
+        'turnRange': (max(target_start_turn, earliest_turn), target_end_turn),
+        'messages': selected,
+        'canPageBackward': earlier,
+        'canPageForward': target_end_turn < -1
+    }
+
+
 @mcp.tool()
-async def read_messages(
+@metrics.timed('tool.read_messages')
+@_in_thread(refresh=True)
+def read_messages(
     session_id: str,
     chapter: Optional[int] = None,
     turn: Optional[int] = None,
     start: Optional[int] = None,
     end: Optional[int] = None,
     expand: int = 0,
-    include_assistant: bool = True
+    include_assistant: bool = True,
+    last: Optional[int] = None,
+    before: Optional[int] = None
 ) -> dict:
     """
     Load actual message content from a session. Use after list_chapters to read specific parts.
 
     Navigation modes (first one wins):
     - chapter: Read messages from that chapter (1-indexed, from list_chapters)
-    - turn: Read messages around that user turn (1-indexed)
+    - turn: Read messages around that user turn (1-indexed; -1 is the latest turn)
+    - last: Read the last N messages, e.g. to continue where a session left off
     - start/end: Read raw message index range
 
     Args:
         session_id: Session ID from search_memory() or list_recent()
         chapter: Chapter number to read (1-indexed)
-        turn: User turn to center on (1-indexed), with context
+        turn: User turn to center on (1-indexed, or negative to count from the end), with context
+        last: Number of messages to read from the end of the session
+        before: With last, only read messages before this index, to page backward
+            (pass pageBackward from the previous call)
         start: Start message index (if not using chapter/turn)
         end: End message index (if not using chapter/turn)
         expand: Extra messages before/after (default: 0)
         include_assistant: Include assistant responses (default: True)
 
     Returns:
-        Messages with navigation info for paging forward/backward
+        Messages with navigation info for paging forward/backward. Read from
+        the end of a session that isn't fully indexed yet, indices and turns
+        are negative, counted from the end.
     """
-    ensure_cache_fresh()
 
-    cache = get_cache()
-
-    if session_id not in cache:
-        return {
+    data = _get_session(session_id)
+    from_end = chapter is None and ((turn is not None and turn < 0) or
+                                    (turn is None and last is not None))
+
+    if data is None and from_end:
+        # Not indexed yet (e.g. during warm-up): the tail needs no index
+        file_path = _find_session_file(session_id)
+        if file_path is not None:
+            if turn is not None:
+                return _with_progress(_read_turn_from_end(session_id, file_path, turn,
+                                                          include_assistant))
+            return _with_progress(_read_tail(session_id, None, file_path, last, before,
+                                             include_assistant))
+
+    if data is None:
+        return _with_progress({
             'error': f'Session "{session_id}" not found. Use search_memory() or list_recent() to find valid session IDs.',
             'success': False
-        }
+        })
 
-    data = cache[session_id]
-    file_path = data.get('file_path')
+    file_path = data.file_path
 
     if not file_path or not os.path.exists(file_path):
         return {
@@ -392,50 +1007,14 @@ async def read_messages(
             'success': False
         }
 
-    entries = parse_jsonl_file(file_path)
-    messages = []
-    message_index = 0
-    user_turn_count = 0
-
-    for entry in entries:
-        if entry.get('type') in ['user', 'assistant']:
-            message_index += 1
+    if from_end and turn is None:
+        return _read_tail(session_id, data, file_path, last, before, include_assistant)
 
-            if entry.get('type') == 'user' and entry.get('message'):
-                user_turn_count += 1
-                messages.append({
-                    'role': 'user',
-                    'content': extract_text_content(entry['message'].get('content', '')),
-                    'timestamp': entry.get('timestamp', ''),
-                    'index': message_index,
-                    'userTurn': user_turn_count
-                })
-            elif entry.get('type') == 'assistant' and entry.get('message'):
-                parts = []
-                for item in entry['message'].get('content', []):
-                    if isinstance(item, dict):
-                        if item.get('type') == 'text':
-                            parts.append(item.get('text', ''))
-                        elif item.get('type') == 'tool_use':
-                            tool_name = item.get('name', 'unknown')
-                            tool_input = item.get('input', {})
-                            tool_detail = _get_tool_detail(tool_name, tool_input)
-                            if tool_detail:
-                                parts.append(f"[{tool_name}: {tool_detail}]")
-                            else:
-                                parts.append(f"[{tool_name}]")
-
-                content = '\n'.join(parts)
-                messages.append({
-                    'role': 'assistant',
-                    'content': content,
-                    'timestamp': entry.get('timestamp', ''),
-                    'index': message_index,
-                    'userTurn': user_turn_count
-                })
-
-    total_messages = len(messages)
-    chapters = data.get('chapters', [])
+    offsets = data.message_offsets
+    turns = data.message_turns
+    total_messages = len(offsets)
+    user_turn_count = turns[-1] if turns else 0
+    chapters = data.chapters
     navigation_mode = None
     actual_start = 0
     actual_end = total_messages
@@ -443,38 +1022,43 @@ async def read_messages(
     if chapter is not None:
         navigation_mode = 'chapter'
         if chapter < 1 or chapter > len(chapters):
-            chapter_titles = [f"{i+1}: {c['title']}" for i, c in enumerate(chapters)]
+            chapter_titles = [f"{i+1}: {c.title}" for i, c in enumerate(chapters)]
             return {
                 'error': f'Chapter {chapter} not found. This session has {len(chapters)} chapters: {chapter_titles}',
                 'success': False
             }
         ch = chapters[chapter - 1]
-        actual_start = ch['message_range'][0]
-        actual_end = ch['message_range'][1]
+        actual_start = ch.start
+        actual_end = ch.end
 
     elif turn is not None:
         navigation_mode = 'turn'
+        requested_turn = turn
+        if turn < 0:
+            if os.path.getsize(file_path) != data.size:
+                return _read_turn_from_end(session_id, file_path, turn, include_assistant)
+            turn += user_turn_count + 1
         if turn < 1 or turn > user_turn_count:
             return {
-                'error': f'Turn {turn} out of range. This session has {user_turn_count} user turns.',
+                'error': f'Turn {requested_turn} out of range. This session has {user_turn_count} user turns.',
                 'success': False
             }
         context_turns = 2
         target_start_turn = max(1, turn - context_turns)
         target_end_turn = min(user_turn_count, turn + context_turns)
 
-        selected = []
-        for msg in messages:
-            msg_turn = msg.get('userTurn', 0)
-            if target_start_turn <= msg_turn <= target_end_turn:
-                if include_assistant or msg['role'] == 'user':
-                    selected.append(msg)
+        # Turns never decrease along the session, so the range is contiguous
+        selected = _load_messages(
+            data,
+            range(bisect_left(turns, target_start_turn), bisect_right(turns, target_end_turn)),
+            include_assistant
+        )
 
         return {
             'success': True,
             'sessionId': session_id,
             'navigationMode': 'turn',
-            'requestedTurn': turn,
+            'requestedTurn': requested_turn,
             'turnRange': (target_start_turn, target_end_turn),
             'totalUserTurns': user_turn_count,
             'messages': selected,
@@ -489,17 +1073,14 @@ async def read_messages(
 
     else:
         return {
-            'error': 'Specify how to navigate: chapter=N, turn=N, or start/end range. Use list_chapters() first to see available chapters.',
+            'error': 'Specify how to navigate: chapter=N, turn=N, last=N, or start/end range. Use list_chapters() first to see available chapters.',
             'success': False
         }
 
     actual_start = max(0, actual_start - expand)
     actual_end = min(total_messages, actual_end + expand)
 
-    selected_messages = messages[actual_start:actual_end]
-
-    if not include_assistant:
-        selected_messages = [msg for msg in selected_messages if msg['role'] == 'user']
+    selected_messages = _load_messages(data, range(actual_start, actual_end), include_assistant)
 
     return {
         'success': True,
@@ -515,15 +1096,64 @@ async def read_messages(
 
 
 @mcp.tool()
-async def list_projects() -> dict:
+@metrics.timed('tool.list_projects')
+@_in_thread(refresh=False)
+def list_projects() -> dict:
     """
     List available projects. Use to discover valid project names for filtering.
 
     Returns:
         List of project directory names (e.g., "-Users-kate-Projects-myapp")
     """
+    store = get_store()
+    if store is not None:
+        return {'projects': store.projects()}
+
     project_dirs = [d for d in glob_module.glob(os.path.join(CLAUDE_PROJECTS_PATH, "*"))
                    if os.path.isdir(d)]
     projects = [os.path.basename(d) for d in project_dirs]
 
     return {'projects': projects}
+
+
+def _collect_stats() -> dict:
+    stats = metrics.snapshot()
+    with cache_lock():
+        cache = get_cache()
+        index = get_search_index()
+        vocabulary = get_vocabulary()
+        stats['cache'] = {
+            'sessions': len(cache),
+            'vocabulary': len(vocabulary),
+            'stemPostings': index.posting_count(),
+            'valueKeys': sum(len(keys) for keys in index.values.values()),
+            'estimatedBytes': (sum(data.estimated_size() for data in cache.values()) +
+                               index.estimated_size() + vocabulary.estimated_size()),
+            'shards': get_shard_counts(),
+        }
+        stats['indexGeneration'] = get_generation()
+    store = get_store()
+    if store is not None:
+        stats['store'] = {'backend': 'sqlite', 'path': store.path, 'sessions': store.count()}
+    stats['stemmer'] = stem_cache_stats()
+    stats['process'] = metrics.process_memory()
+    stats['jsonBackend'] = BACKEND
+    return stats
+
+
+@mcp.tool()
+@_in_thread(refresh=False)
+def memory_stats() -> dict:
+    """
+    Performance counters for this server, for diagnosing slow searches or memory growth.
+
+    Returns:
+        Per-tool and per-stage timers (count, mean, max, p50/p90/p99, histogram),
+        counters (files extracted vs unchanged, bytes and lines read, lines skimmed),
+        cache and index sizes, stemmer cache hit data, and process memory
+    """
+    return _collect_stats()
+
+
+if METRICS_PATH:
+    atexit.register(lambda: metrics.dump(METRICS_PATH, _collect_stats()))
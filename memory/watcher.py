@@ -0,0 +1,201 @@
+"""
+Background watcher that keeps the conversation cache live.
+
+Runs alongside the MCP server so tool calls read the cache without paying
+for stat calls or parsing on the request path. Uses inotify (Linux, via
+ctypes) when available and falls back to a polling thread elsewhere.
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from typing import Dict, Optional, Set
+
+from . import CLAUDE_PROJECTS_PATH
+from .cache import refresh_cache, refresh_paths, set_watching
+
+
+# Seconds between sweeps in polling mode
+POLL_INTERVAL = 2.0
+
+# Seconds to wait for more events before indexing a batch of changed files
+DEBOUNCE = 0.25
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+
+_ROOT_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+_PROJECT_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE |
+                 IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class PollingWatcher:
+    """Re-runs the cheap change sweep on a timer"""
+
+    def __init__(self, root: str = CLAUDE_PROJECTS_PATH, interval: float = POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                refresh_cache()
+            except Exception as e:
+                print(f"Error refreshing index: {e}", file=sys.stderr)
+            set_watching(True)
+            self._stop.wait(self.interval)
+
+
+class InotifyWatcher:
+    """Queues changed session files from inotify events and indexes them in batches"""
+
+    def __init__(self, root: str = CLAUDE_PROJECTS_PATH):
+        self.root = root
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: Dict[int, str] = {}
+        self._changed: 'queue.Queue[str]' = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-watcher', daemon=True)
+
+    def start(self):
+        self._add_watch(self.root, _ROOT_MASK)
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith('.') and entry.is_dir():
+                self._add_watch(entry.path, _PROJECT_MASK)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _add_watch(self, path: str, mask: int):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def _run(self):
+        # Initial sweep picks up anything that changed while no server was
+        # running; until it's done, tool calls keep refreshing for themselves
+        try:
+            refresh_cache()
+        except Exception as e:
+            print(f"Error refreshing index: {e}", file=sys.stderr)
+        set_watching(True)
+
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 1.0)
+            if not ready:
+                continue
+
+            overflow = self._read_events()
+            # Let a burst of writes settle into one batch
+            time.sleep(DEBOUNCE)
+            overflow |= self._read_events()
+
+            paths: Set[str] = set()
+            while not self._changed.empty():
+                paths.add(self._changed.get_nowait())
+
+            try:
+                if overflow:
+                    refresh_cache()
+                elif paths:
+                    refresh_paths(paths)
+            except Exception as e:
+                print(f"Error refreshing index: {e}", file=sys.stderr)
+
+    def _read_events(self) -> bool:
+        """Drain pending events into the queue. Returns True on queue overflow."""
+        overflow = False
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return overflow
+            if not buf:
+                return overflow
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                parent = self._dirs.get(wd)
+                if parent is None:
+                    continue
+                if mask & IN_DELETE_SELF:
+                    self._dirs.pop(wd, None)
+                    continue
+
+                path = os.path.join(parent, name)
+                if parent == self.root:
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_watch(path, _PROJECT_MASK)
+                        # Files may have landed before the watch was added
+                        overflow = True
+                    elif mask & IN_ISDIR and mask & (IN_DELETE | IN_MOVED_FROM):
+                        overflow = True
+                elif name.endswith('.jsonl') and not name.startswith('.'):
+                    self._changed.put(path)
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def start_watcher(mode: str = 'auto') -> Optional[object]:
+    """
+    Start keeping the cache live in the background.
+    mode: "poll", or anything else for inotify where available, else poll
+    """
+    watcher = None
+
+    if mode != 'poll' and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher()
+            watcher.start()
+        except Exception as e:
+            print(f"inotify unavailable, polling instead: {e}", file=sys.stderr)
+            watcher = None
+
+    if watcher is None:
+        watcher = PollingWatcher()
+        watcher.start()
+
+    return watcher
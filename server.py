@@ -6,7 +6,20 @@ Gives Claude Code persistent memory across sessions by indexing conversation his
 Uses todos as chapter markers, activity signals for context, and manual notes for breadcrumbs.
 """
 
+import sys
+
+from memory import WATCH_MODE
+from memory.cache import start_warmup
+from memory.decoder import BACKEND as JSON_BACKEND
 from memory.tools import mcp
+from memory.watcher import start_watcher
 
 if __name__ == "__main__":
+    # stdout carries the MCP protocol, so diagnostics go to stderr
+    print(f"claude-memory: JSON backend {JSON_BACKEND}", file=sys.stderr)
+    # Index in the background, newest sessions first; tools answer from what
+    # is ready and report indexingProgress until it's done
+    start_warmup()
+    if WATCH_MODE:
+        start_watcher(WATCH_MODE)
     mcp.run()